@@ -1,13 +1,31 @@
 import streamlit as st
 import random
+import csv
 import datetime
-import json
+import io
 import time
-import os
-from collections import Counter
+import uuid
 from datetime import datetime as dt, timedelta
 import streamlit.components.v1 as components
 
+from word_engine import (
+    CHECKIN_FILE, LOG_NAME, METRICS_FILE, QUIZ_RESULT_NAME, REVIEW_FLUSH_SIZE,
+    STATS_RECENT_DAYS, UNDATED_MONTH, acting_user, add_or_update_word,
+    adopt_legacy_data, answer_quiz, buffer_review_change, clear_checkins,
+    clear_quiz_results, export_words, find_word, flush_persistence, flush_review_buffer,
+    flush_stale_review_buffers, get_answer_log, get_review_scheduler, get_shared_vocab,
+    get_word_index, get_words, grade_word, has_quiz_results, import_words,
+    level_breakdown, load_checkin_state, load_quiz_results, load_quiz_state,
+    load_quiz_summaries, load_stats_summary, load_today_words, load_words_between,
+    metrics, new_quiz, persist_answer, persist_checkin, persist_quiz_result,
+    persist_quiz_state, persist_today_words, persistence, quiz_done, quiz_fingerprint,
+    quiz_position, quiz_question, quiz_score, rebuild_stats_rollup, recent_days_frame,
+    recover_review_journals, remove_word, rename_word, replace_all_words, review_event,
+    search_word_keys, today_iso, update_meaning, word_count, word_file_format,
+    wrong_counts_frame,
+)
+from analytics import daily_frame, load_report, refresh_error, refresh_report_async, report_is_current
+
 # --------------------
 # 假資料（用於登入驗證）
 # --------------------
@@ -16,189 +34,142 @@ FAKE_USERS = {
     "user2": "password2",
     "admin": "admin123"
 }
+ADMIN_USERS = {"admin"}  # 可以看系統監控頁的帳號
 
 FAKE_CHECKINS = []  # 模擬打卡紀錄
 
 # --------------------
-# 單字永久儲存功能
+# 複習評分暫存（write-behind）：先記在 session 與 journal，湊滿一批再寫回
 # --------------------
-WORDS_FILE = "words.json"
-TODAY_WORDS_FILE = f"today_words_{datetime.date.today().isoformat()}.json"
-
-def load_words():
-    if os.path.exists(WORDS_FILE):
-        with open(WORDS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    else:
-        return []
-
-def save_words(words):
-    with open(WORDS_FILE, "w", encoding="utf-8") as f:
-        json.dump(words, f, ensure_ascii=False, indent=2)
-
-def load_today_words():
-    if os.path.exists(TODAY_WORDS_FILE):
-        with open(TODAY_WORDS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    else:
-        return []
-
-def save_today_words(words):
-    with open(TODAY_WORDS_FILE, "w", encoding="utf-8") as f:
-        json.dump(words, f, ensure_ascii=False, indent=2)
-
-# 在主程式一開始載入
-if "words_data" not in st.session_state:
-    st.session_state["words_data"] = load_words()
-
-if "words" not in st.session_state:
-    st.session_state["words"] = load_today_words()
+def _review_session_id():
+    if "review_session_id" not in st.session_state:
+        st.session_state["review_session_id"] = uuid.uuid4().hex
+    return st.session_state["review_session_id"]
+
+def queue_review_change(entry):
+    """評分先寫 journal 再放進暫存（暫存在 word_engine），湊滿一批就寫回"""
+    if buffer_review_change(_review_session_id(), entry) >= REVIEW_FLUSH_SIZE:
+        flush_review_changes()
+
+def maybe_flush_review_changes():
+    # 這位使用者暫存太久的評分都寫回，包含其他閒置或已關閉的分頁的
+    notify_persist(flush_stale_review_buffers())
+
+def flush_review_changes():
+    notify_persist(flush_review_buffer(_review_session_id()))
+
+def notify_persist(queued):
+    # 背景寫入佇列滿了時，這次點擊有等待寫入，提示使用者不是當機
+    if not queued:
+        st.toast("資料寫入中，請稍候…")
+
+def init_user_session(user):
+    """登入後（在 acting_user 區塊內）準備這位使用者的資料"""
+    adopt_legacy_data(user)
+    recover_review_journals(user)
+    get_shared_vocab().current_words()
+    today = today_iso()
+    if "words" not in st.session_state or st.session_state.get("words_day") != today:
+        # 第一次進來或 session 跨過午夜：換成這一天的單字
+        flush_persistence()  # 同一位使用者的其他 session 可能還有沒寫完的今日單字
+        st.session_state["words"] = load_today_words(today)
+        st.session_state["words_day"] = today
 
 # --------------------
-# 選擇題測驗功能
+# 選擇題測驗功能（出題邏輯在 word_engine）
 # --------------------
-def generate_choice_questions():
-    words = st.session_state["words_data"]
-    questions = []
-    if len(words) < 2:
-        return questions  # 至少要兩個單字才有干擾選項
-    for w in words:
-        options = [w["meaning"]]
-        distractors = [x["meaning"] for x in words if x["word"] != w["word"] and x["meaning"]]
-        options += random.sample(distractors, min(3, len(distractors)))
-        random.shuffle(options)
-        answer_index = options.index(w["meaning"])
-        questions.append({
-            "word": w["word"],
-            "options": options,
-            "answer_index": answer_index
-        })
-    return questions
+def quiz_display_word(key):
+    w = find_word(key)
+    return w["word"] if w else key
 
 def quiz_page():
     st.title("📘 學習單字選擇題測驗")
     num_options = [5, 10, 20]
-    words_total = len(st.session_state["words_data"])
+    words_total = word_count()
 
-    # 只在 quiz_started 為 False 時顯示選擇題數與開始測驗
-    if "quiz_started" not in st.session_state or not st.session_state.quiz_started:
+    # session 裡只放精簡的測驗狀態（種子、單字 key、作答編號），題目每次依種子重新產生
+    quiz = st.session_state.get("quiz")
+    if quiz is None:
         num_q = st.radio("請選擇測驗題數：", num_options, horizontal=True, index=0, key="quiz_num_select")
         if words_total == 0:
             st.info("請先在學習頁新增單字。")
             return
-
-        actual_num = min(num_q, words_total)
-        if st.button("開始測驗"):
-            all_questions = generate_choice_questions()
-            if len(all_questions) > actual_num:
-                questions = random.sample(all_questions, actual_num)
+        flush_persistence()  # 剛答完或放棄的進度可能還在背景寫入
+        saved = load_quiz_state()
+        if saved is not None:
+            st.info(f"上次的測驗還沒做完（做到第 {quiz_position(saved) + 1} / {len(saved['keys'])} 題）")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("繼續上次的測驗"):
+                    quiz = saved
+            with col2:
+                if st.button("放棄上次的測驗"):
+                    notify_persist(persist_quiz_state(None))
+        if quiz is None:
+            if not st.button("開始測驗"):
+                return  # 還沒按開始測驗就不顯示題目
+            quiz = new_quiz(get_words(), min(num_q, words_total))
+            if quiz is None:
+                st.info("請先在學習頁新增至少兩個有意思的單字，才能進行選擇題測驗。")
+                return
+            notify_persist(persist_quiz_state(quiz))
+        st.session_state.quiz = quiz
+
+    if not quiz_done(quiz):
+        position = quiz_position(quiz)
+        q = quiz_question(quiz, position)
+        if q is None:
+            # 題目單字在測驗途中被刪掉了，跳過這題
+            quiz, _, _ = answer_quiz(quiz, None)
+            st.session_state.quiz = quiz
+            notify_persist(persist_quiz_state(None if quiz_done(quiz) else quiz))
+            st.rerun()
+        st.subheader(f"題目 {position + 1}: {q['word']}")
+        choice = st.radio("請選擇正確意思：", q["options"], index=None, key=f"quiz_choice_{quiz['seed']}_{position}")
+
+        if st.button("提交答案") and choice is not None:
+            quiz, q, correct = answer_quiz(quiz, q["options"].index(choice))
+            if correct:
+                st.success("✅ 答對了！")
             else:
-                questions = all_questions
-            st.session_state.quiz_questions = questions
-            st.session_state.current_q = 0
-            st.session_state.score = 0
-            st.session_state.log = []
-            st.session_state.quiz_started = True
-        else:
-            return  # 還沒按開始測驗就不顯示題目
-
-    questions = st.session_state.get("quiz_questions", [])
-
-    if not questions:
-        st.info("請先在學習頁新增至少兩個有意思的單字，才能進行選擇題測驗。")
-        return
-
-    if st.session_state.current_q < len(questions):
-        q = questions[st.session_state.current_q]
-        st.subheader(f"題目 {st.session_state.current_q + 1}: {q['word']}")
-        choice = st.radio("請選擇正確意思：", q["options"], index=None, key=f"quiz_choice_{st.session_state.current_q}")
-
-        # 狀態: 是否已提交本題答案
-        answered_key = f"quiz_answered_{st.session_state.current_q}"
-        if answered_key not in st.session_state:
-            st.session_state[answered_key] = False
-
-        if not st.session_state[answered_key]:
-            if st.button("提交答案") and choice is not None:
-                correct = q["options"].index(choice) == q["answer_index"]
-                if correct:
-                    st.success("✅ 答對了！")
-                    st.session_state.score += 1
-                else:
-                    st.error(f"❌ 答錯了，正確答案是：{q['options'][q['answer_index']]}")
-                # 不論對錯都寫入 log.json
-                log_item = {
-                    "word": q["word"],
-                    "your_answer": choice,
-                    "correct_answer": q["options"][q["answer_index"]],
-                    "is_correct": correct
-                }
-                if os.path.exists("log.json"):
-                    with open("log.json", "r", encoding="utf-8") as f:
-                        old_log = json.load(f)
-                else:
-                    old_log = []
-                old_log.append(log_item)
-                with open("log.json", "w", encoding="utf-8") as f:
-                    json.dump(old_log, f, ensure_ascii=False, indent=2)
-                st.session_state.log.append(log_item)
-                st.session_state[answered_key] = True
-                # 直接進入下一題
-                st.session_state.current_q += 1
-                st.session_state.pop(f"quiz_choice_{st.session_state.current_q-1}", None)
-                st.session_state.pop(answered_key, None)
+                st.error(f"❌ 答錯了，正確答案是：{q['options'][q['answer_index']]}")
+            # 不論對錯都追加一行到 log.jsonl，並累加到統計彙總（背景寫入）
+            log_item = {
+                "word": q["word"],
+                "your_answer": choice,
+                "correct_answer": q["options"][q["answer_index"]],
+                "is_correct": correct,
+                "answered_at": dt.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            notify_persist(persist_answer(log_item))
+            # 進度一起存起來，重新整理頁面後可以從下一題接著做；做完就刪掉
+            st.session_state.quiz = quiz
+            notify_persist(persist_quiz_state(None if quiz_done(quiz) else quiz))
     else:
-        # 測驗結束只顯示本次測驗結果
-        quiz_time = dt.now().strftime("%Y-%m-%d %H:%M:%S")
-        total = len(questions)
-        correct = st.session_state.score
+        # 測驗結束只顯示本次測驗結果；完成時間與寫檔都只在第一次進到結果畫面時做
+        correct, total, wrong_keys = quiz_score(quiz)
         accuracy = round((correct / total) * 100, 2) if total > 0 else 0
-        wrong_words = [item["word"] for item in st.session_state.log if not item["is_correct"]]
+        wrong_words = [quiz_display_word(k) for k in wrong_keys]
         wrong_words_str = ", ".join(wrong_words) if wrong_words else "無"
+        if quiz["finished_at"] is None:
+            quiz = st.session_state.quiz = dict(quiz, finished_at=dt.now().strftime("%Y-%m-%d %H:%M:%S"))
+            # 儲存到 quiz_result（避免重複，依 題數+正確率+錯誤單字+單字列表 的指紋判斷）
+            quiz_words = [quiz_display_word(k) for k in quiz["keys"]]
+            persist_quiz_result({
+                "測驗時間": quiz["finished_at"],
+                "題數": total,
+                "正確率": f"{accuracy}%",
+                "錯誤單字": wrong_words_str,
+                "單字列表": quiz_words,
+                "指紋": quiz_fingerprint(total, f"{accuracy}%", wrong_words, quiz_words)
+            })
         st.balloons()
         st.markdown(f"### 🎉 測驗結束！")
-        st.markdown(f"#### 測驗完成時間：{quiz_time}")
+        st.markdown(f"#### 測驗完成時間：{quiz['finished_at']}")
         st.markdown(f"#### 正確率：{accuracy}%")
         st.markdown(f"#### 錯誤單字：{wrong_words_str}")
-        # 儲存到 quiz_result.json（避免重複，依 題數+正確率+錯誤單字 判斷）
-        result_row = {
-            "測驗時間": quiz_time,
-            "題數": total,
-            "正確率": f"{accuracy}%",
-            "錯誤單字": wrong_words_str
-        }
-        if os.path.exists("quiz_result.json"):
-            with open("quiz_result.json", "r", encoding="utf-8") as f:
-                quiz_results = json.load(f)
-        else:
-            quiz_results = []
-        is_duplicate = False
-        for r in quiz_results:
-            if (
-                r.get("題數") == total and
-                r.get("正確率") == f"{accuracy}%" and
-                r.get("錯誤單字") == wrong_words_str
-            ):
-                # 新增：比對單字內容
-                # 取出本次測驗的所有單字
-                current_words = set([q["word"] for q in questions])
-                # 取出歷史紀錄的所有單字（需額外存一個欄位）
-                record_words = set(r.get("單字列表", []))
-                if current_words == record_words:
-                    is_duplicate = True
-                    break
-        # 新增：將本次單字列表存入紀錄
-        result_row["單字列表"] = [q["word"] for q in questions]
-        if not is_duplicate:
-            quiz_results.append(result_row)
-            with open("quiz_result.json", "w", encoding="utf-8") as f:
-                json.dump(quiz_results, f, ensure_ascii=False, indent=2)
         if st.button("重新開始"):
-            st.session_state.quiz_questions = []
-            st.session_state.current_q = 0
-            st.session_state.score = 0
-            st.session_state.log = []
-            st.session_state.quiz_started = False
+            st.session_state.pop("quiz", None)
             st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
 
 # --------------------
@@ -218,8 +189,7 @@ def home_page():
         with col1:
             if st.button("是，清空所有單字"):
                 st.session_state["words"] = []
-                st.session_state["words_data"] = []
-                save_words([])
+                replace_all_words([])
                 st.success("已清空所有單字資料！")
                 st.session_state.show_clear_words_confirm = False
         with col2:
@@ -249,26 +219,18 @@ def study_page():
 
     if st.button("新增單字"):
         if new_word and new_meaning:
-            exist = next((w for w in st.session_state["words_data"] if w["word"].lower() == new_word), None)
-            if exist:
-                exist["meaning"] = new_meaning  # 更新意思
-            else:
-                st.session_state["words_data"].append({
-                    "word": new_word,
-                    "meaning": new_meaning,
-                    "level": 1,
-                    "last_review": datetime.date.today().isoformat()
-                })
-            save_words(st.session_state["words_data"])
+            add_or_update_word(new_word, new_meaning)
             if "words" not in st.session_state:
                 st.session_state["words"] = []
             if new_word not in [w.lower() for w in st.session_state["words"]]:
                 st.session_state["words"].append(new_word)
-                save_today_words(st.session_state["words"])
+                notify_persist(persist_today_words(st.session_state["words"], st.session_state.get("words_day")))
             st.success(f"已新增：{new_word} - {new_meaning}")
         else:
             st.error("請輸入完整的英文單字與中文意思！")
 
+    bulk_words_section()
+
     if st.button("完成今日學習"):
         user = st.session_state.get("current_user", "")
         today_words = st.session_state.get("words", [])
@@ -279,38 +241,76 @@ def study_page():
                 "words_learned": today_words
             }
             st.success("今日學習已完成！明天繼續努力！")
-            # 新增：寫入一筆學習打卡到 checkin.json
+            # 新增：追加一筆學習打卡到 checkin.jsonl
             checkin_record = {
                 "user": user,
                 "datetime": dt.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "type": "study",  # 標記這是學習打卡
                 "words_learned": today_words
             }
-            if os.path.exists("checkin.json"):
-                with open("checkin.json", "r", encoding="utf-8") as f:
-                    checkins = json.load(f)
-            else:
-                checkins = []
-            checkins.append(checkin_record)
-            with open("checkin.json", "w", encoding="utf-8") as f:
-                json.dump(checkins, f, ensure_ascii=False, indent=2)
+            notify_persist(persist_checkin(checkin_record))
         else:
             st.warning("今日還未新增單字，請勿偷懶！")
 
     st.subheader("已學單字")
     if "words" in st.session_state and st.session_state["words"]:
         for word in st.session_state["words"]:
-            meaning = next((w["meaning"] for w in st.session_state["words_data"] if w["word"].lower() == word.lower()), "")
+            w = find_word(word)
+            meaning = w["meaning"] if w else ""
             st.write(f"- {word}（{meaning}）")
     else:
         st.write("尚未記錄任何單字。")
 
+    st.subheader("過去學過的單字")
+    today = datetime.date.today()
+    picked = st.date_input("日期範圍", value=(today - timedelta(days=6), today), max_value=today)
+    if isinstance(picked, (tuple, list)) and len(picked) == 2:
+        by_day = load_words_between(picked[0].isoformat(), picked[1].isoformat())
+        if by_day:
+            for day in sorted(by_day, reverse=True):
+                st.write(f"**{day}**（{len(by_day[day])} 個）：{', '.join(by_day[day])}")
+        else:
+            st.write("這段期間沒有學習紀錄。")
+
+IMPORT_POLICY_LABELS = {
+    "skip": "保留原本的意思",
+    "overwrite": "改成檔案裡的意思",
+    "append": "合併兩邊的意思",
+}
+
+def bulk_words_section():
+    """批次匯入／匯出單字（CSV、TSV、JSONL），整份檔案只寫入一次"""
+    with st.expander("批次匯入／匯出"):
+        uploaded = st.file_uploader("上傳單字檔（欄位：word, meaning[, level, last_review]）", type=["csv", "tsv", "jsonl"])
+        policy = st.radio("單字已存在時", list(IMPORT_POLICY_LABELS), format_func=IMPORT_POLICY_LABELS.get, horizontal=True)
+        if uploaded is not None and st.button("匯入"):
+            uploaded.seek(0)  # 上一次匯入失敗時可能停在檔案中間
+            stream = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+            try:
+                counts = import_words(stream, word_file_format(uploaded.name), policy)
+            except UnicodeDecodeError:
+                st.error("檔案不是 UTF-8 編碼，請另存成 UTF-8 後再上傳。沒有匯入任何單字。")
+            except (ValueError, csv.Error) as e:
+                st.error(f"無法讀取檔案：{e}。沒有匯入任何單字。")
+            else:
+                st.success(f"新增 {counts['added']}、更新 {counts['updated']}、略過 {counts['skipped']}、格式不符 {counts['invalid']}")
+            finally:
+                stream.detach()  # 上傳的檔案物件交還給 Streamlit，不要跟著 wrapper 一起關掉
+        fmt = st.selectbox("匯出格式", ["csv", "tsv", "jsonl"])
+        if st.button("準備匯出檔"):
+            out = io.StringIO()
+            export_words(out, fmt)
+            st.session_state["export_file"] = (fmt, out.getvalue())
+        if "export_file" in st.session_state:
+            fmt, data = st.session_state["export_file"]
+            st.download_button("下載單字檔", data, file_name=f"words.{fmt}")
+
 def word_cards_page():
     st.title("單字卡片")
     if "words" in st.session_state and st.session_state["words"]:
         for word in st.session_state["words"]:
-            word_key = word.strip().lower()
-            meaning = next((w["meaning"] for w in st.session_state["words_data"] if w["word"].strip().lower() == word_key and w["meaning"]), None)
+            w = find_word(word)
+            meaning = w["meaning"] if w and w["meaning"] else None
             if meaning:
                 with st.expander(f"單字: {word}"):
                     st.write(f"意思: {meaning}")
@@ -319,26 +319,69 @@ def word_cards_page():
     else:
         st.info("尚未記錄任何單字，請先到學習頁新增單字。")
 
+def _fmt(value, percent=False):
+    if value is None:
+        return "-"
+    return f"{round(value * 100, 1)}%" if percent else f"{value:g}"
+
+def analytics_section():
+    """記憶分析：直接顯示上次算好的報表，作答或複習紀錄有變時在背景重算"""
+    st.subheader("🧠 記憶分析")
+    report = load_report()
+    current = report_is_current(report)
+    if not current:
+        refresh_report_async(st.session_state["current_user"])
+    error = refresh_error()
+    if error:
+        st.error(f"記憶分析報表產生失敗：{error}")
+    if report is None:
+        st.info("正在第一次產生記憶分析報表，請稍後重新整理。")
+        if st.button("重新整理", key="analytics_reload"):
+            st.rerun()
+        return
+    note = "" if current else "；有新的作答或複習，正在背景更新"
+    totals = report["totals"]
+    st.caption(f"報表產生於 {report['generated_at']}（{totals['words']} 個單字、{totals['answers']} 次作答、{totals['reviews']} 次複習）{note}")
+    st.table([{
+        "Level": row["level"],
+        "單字數": row["words"],
+        "複習次數": row["reviews"],
+        "記得比例": _fmt(row["retention"], percent=True),
+        "平均複習間隔（天）": _fmt(row["mean_interval_days"]),
+        "忘記前間隔中位數（天）": _fmt(row["median_days_to_forget"]),
+        "半衰期估計（天）": _fmt(row["half_life_days"]),
+    } for row in report["levels"]])
+    st.write("最近每天的作答、複習與新學單字：")
+    st.bar_chart(daily_frame(report))
+    if report["hardest_words"]:
+        st.write("最容易忘記的單字（作答正確率與複習記得比例的平均最低）：")
+        st.table([{
+            "單字": row["word"],
+            "意思": row["meaning"] or "",
+            "作答": row["attempts"],
+            "正確率": _fmt(row["accuracy"], percent=True),
+            "複習": row["reviews"],
+            "記得比例": _fmt(row["retention"], percent=True),
+        } for row in report["hardest_words"]])
+
 def stats_page():
     st.title("單字測驗結果分析報告")
-    # 讀取 log.json
-    if not os.path.exists("log.json"):
-        st.warning("尚未發現測驗紀錄檔 log.json，請先完成測驗並儲存紀錄。")
+    flush_persistence()  # 剛作答、打卡的結果在背景寫入，讀統計前先等它寫完
+    # 直接讀取統計彙總，不必重掃作答紀錄
+    summary = load_stats_summary()
+    if summary["total"] == 0 and not get_answer_log().exists():
+        st.warning(f"尚未發現測驗紀錄（{LOG_NAME}.YYYY-MM.jsonl），請先完成測驗並儲存紀錄。")
         return
 
-    with open("log.json", "r", encoding="utf-8") as f:
-        log_data = json.load(f)
-
     # 分析錯誤率與錯誤單字
-    total = len(log_data)
-    correct = sum(1 for item in log_data if item["is_correct"])
+    total = summary["total"]
+    correct = summary["correct"]
     wrong = total - correct
     accuracy = round((correct / total) * 100, 2) if total > 0 else 0
     error_rate = round(100 - accuracy, 2) if total > 0 else 0
 
-    # 錯誤單字統計
-    wrong_words = [item["word"] for item in log_data if not item["is_correct"]]
-    wrong_counts = Counter(wrong_words).most_common()
+    # 錯誤單字統計（只取最常錯的前幾名）
+    wrong_counts = summary["wrong_counts"]
 
     # 顯示統計資訊
     st.subheader("測驗統計")
@@ -352,102 +395,119 @@ def stats_page():
         st.subheader("遺忘單字提示")
         st.info("以下單字曾經答錯多次，建議重複複習：")
         # 以表格方式呈現
-        import pandas as pd
-        df_wrong = pd.DataFrame(wrong_counts, columns=["單字", "錯誤次數"])
-        st.table(df_wrong)
-
-    # 歷史測驗分析紀錄表格
-    if os.path.exists("quiz_result.json"):
-        with open("quiz_result.json", "r", encoding="utf-8") as f:
-            quiz_results = json.load(f)
-        # 新增：加上編號，從1開始
-        for idx, row in enumerate(quiz_results, start=1):
+        st.table(wrong_counts_frame(summary))
+
+    # 每日作答題數
+    if summary["recent_days"]:
+        st.subheader(f"最近 {STATS_RECENT_DAYS} 天作答題數")
+        st.bar_chart(recent_days_frame(summary))
+
+    analytics_section()
+
+    if st.button("從測驗紀錄重建統計"):
+        rebuilt = rebuild_stats_rollup()
+        st.success(f"已從作答紀錄與每月摘要重建統計，共 {rebuilt} 題。")
+        st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
+
+    # 歷史測驗分析紀錄表格：保留期內逐筆列出，更早的月份只剩每月摘要
+    if has_quiz_results():
+        quiz_summaries = load_quiz_summaries()
+        if quiz_summaries:
+            st.subheader("📊 較早的測驗（每月摘要）")
+            st.table([{
+                "月份": s["month"] if s["month"] != UNDATED_MONTH else "（無日期）",
+                "測驗次數": s["quizzes"],
+                "題數": s["questions"],
+                "正確率": f"{round(s['correct'] / s['questions'] * 100, 2) if s['questions'] else 0}%",
+                "最常錯的單字": ", ".join(list(s["wrong_words"])[:5]) or "無",
+            } for s in quiz_summaries])
+        quiz_results = load_quiz_results()
+        # 新增：加上編號，接在已壓縮的測驗之後
+        for idx, row in enumerate(quiz_results, start=sum(s["quizzes"] for s in quiz_summaries) + 1):
             row["編號"] = idx
-        # 讓「編號」顯示在最前面
+        # 讓「編號」顯示在最前面，指紋只供比對不顯示
         if quiz_results:
-            cols = ["編號"] + [k for k in quiz_results[0] if k != "編號"]
+            cols = ["編號"] + [k for k in quiz_results[0] if k not in ("編號", "指紋")]
             st.subheader("📊 歷史測驗分析紀錄")
-            st.table([{k: row[k] for k in cols} for row in quiz_results])
+            st.table([{k: row.get(k) for k in cols} for row in quiz_results])
         else:
             st.subheader("📊 歷史測驗分析紀錄")
             st.write("尚無紀錄")
 
     # 歷史測驗分析紀錄管理（刪除按鈕）
     st.subheader("📊 歷史測驗分析紀錄管理")
-    if st.button("刪除所有歷史測驗分析紀錄（quiz_result.json）"):
+    if st.button(f"刪除所有歷史測驗分析紀錄（{QUIZ_RESULT_NAME}.*.jsonl）"):
         st.session_state.show_clear_quiz_result_confirm = True
     if st.session_state.get("show_clear_quiz_result_confirm", False):
         st.warning("確定要刪除所有歷史測驗分析紀錄嗎？此動作無法復原！")
         col1, col2 = st.columns(2)
         with col1:
             if st.button("是，刪除所有紀錄"):
-                if os.path.exists("quiz_result.json"):
-                    with open("quiz_result.json", "w", encoding="utf-8") as f:
-                        json.dump([], f, ensure_ascii=False, indent=2)
-                st.success("已刪除 quiz_result.json！")
+                clear_quiz_results()
+                st.success("已刪除所有歷史測驗分析紀錄！")
                 st.session_state.show_clear_quiz_result_confirm = False
         with col2:
             if st.button("否", key="cancel_clear_quiz_result"):
                 st.session_state.show_clear_quiz_result_confirm = False
-    # 讀取 checkin.json
-    if os.path.exists("checkin.json"):
-        with open("checkin.json", "r", encoding="utf-8") as f:
-            checkins = json.load(f)
-        # 計算所有打卡（學習與測驗）
-        answer_count = len(checkins)
-        # 取出所有打卡日期
-        answer_dates = [c["datetime"][:10] for c in checkins]
-        unique_dates = sorted(set(answer_dates))
-        # 計算最長連續打卡天數
-        max_streak = 0
-        streak = 0
-        last_date = None
-        for d in unique_dates:
-            d_obj = dt.strptime(d, "%Y-%m-%d")
-            if last_date is None or (d_obj - last_date).days == 1:
-                streak += 1
-            else:
-                streak = 1
-            if streak > max_streak:
-                max_streak = streak
-            last_date = d_obj
-        st.subheader("打卡分析")
-        st.write(f"累積打卡天數：{len(unique_dates)}")
-        st.write(f"最長連續打卡天數：{max_streak}")
+    # 讀取目前使用者的打卡狀態（累積與連續天數在打卡時就已算好）
+    st.subheader("打卡分析")
+    checkin_state = load_checkin_state(st.session_state.get("current_user", ""))
+    if checkin_state["days"]:
+        st.write(f"累積打卡天數：{checkin_state['days']}")
+        st.write(f"目前連續打卡天數：{checkin_state['streak']}")
+        st.write(f"最長連續打卡天數：{checkin_state['max_streak']}")
     else:
-        st.subheader("打卡分析")
         st.info("目前沒有打卡紀錄。")
 
     # 加入清空打卡資料按鈕
     st.subheader("⚠️ 打卡管理")
-    if st.button("清空所有打卡資料（checkin.json）"):
+    if st.button(f"清空所有打卡資料（{CHECKIN_FILE}）"):
         st.session_state.show_clear_checkin_confirm = True
     if st.session_state.get("show_clear_checkin_confirm", False):
         st.warning("確定要清空所有打卡資料嗎？此動作無法復原！")
         col1, col2 = st.columns(2)
         with col1:
             if st.button("是，清空所有打卡資料"):
-                for fname in ["checkin.json"]:
-                    if os.path.exists(fname):
-                        with open(fname, "w", encoding="utf-8") as f:
-                            json.dump([], f, ensure_ascii=False, indent=2)
-                st.success("已清空 checkin.json！")
+                clear_checkins()
+                st.success(f"已清空 {CHECKIN_FILE}！")
                 st.session_state.show_clear_checkin_confirm = False
                 st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
         with col2:
             if st.button("否", key="cancel_clear_checkin"):
                 st.session_state.show_clear_checkin_confirm = False
 
+# --------------------
+# 單字總覽（搜尋與分頁由 word_engine 的索引處理）
+# --------------------
+OVERVIEW_PAGE_SIZE = 50
+
 def word_overview_page():
     st.title("單字總覽")
-    words = st.session_state.get("words_data", [])
-    if not words:
+    if not word_count():
         st.info("目前沒有單字紀錄。")
         return
-    # 依英文單字排序
-    sorted_words = sorted(words, key=lambda x: x["word"].lower())
-    for idx, w in enumerate(sorted_words):
-        row_key = f"word_{idx}_{w['word']}"
+    query = st.text_input("搜尋（英文前綴或中文意思）", key="overview_query")
+    # 換搜尋條件時回到第一頁
+    if st.session_state.get("overview_last_query") != query:
+        st.session_state["overview_last_query"] = query
+        st.session_state["overview_page"] = 1
+    page = st.session_state.get("overview_page", 1)
+    page_keys, total = search_word_keys(query, page - 1, OVERVIEW_PAGE_SIZE)
+    if total == 0:
+        st.info("找不到符合的單字。")
+        return
+    pages = (total + OVERVIEW_PAGE_SIZE - 1) // OVERVIEW_PAGE_SIZE
+    if page > pages:
+        # 刪除單字後總頁數變少，停在最後一頁
+        page = pages
+        st.session_state["overview_page"] = page
+        page_keys, _ = search_word_keys(query, page - 1, OVERVIEW_PAGE_SIZE)
+    st.number_input(f"頁數（共 {pages} 頁，{total} 個單字）", min_value=1, max_value=pages, step=1, key="overview_page")
+    index = get_word_index()
+    # 依英文單字排序，只產生這一頁的列
+    for key in page_keys:
+        w = index[key]
+        row_key = f"word_{key}"
         edit_key = f"edit_{row_key}"
         del_key = f"del_{row_key}"
         confirm_del_key = f"confirm_del_{row_key}"
@@ -463,11 +523,11 @@ def word_overview_page():
                     new_word = st.text_input("編輯英文單字", value=w["word"], key=f"edit_word_input_{row_key}")
                     if st.button("儲存", key=f"save_word_{row_key}"):
                         # 檢查重複
-                        if new_word and new_word != w["word"] and any(x["word"] == new_word for x in words):
+                        exist = find_word(new_word) if new_word else None
+                        if exist is not None and exist is not w:
                             st.error("已有相同英文單字，請重新輸入！")
                         elif new_word:
-                            w["word"] = new_word
-                            save_words(words)
+                            rename_word(w, new_word)
                             st.session_state[edit_key] = False
                             st.success("已更新！")
                             st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
@@ -482,8 +542,7 @@ def word_overview_page():
                     new_meaning = st.text_input("編輯中文意思", value=w["meaning"], key=f"edit_meaning_input_{row_key}")
                     if st.button("儲存", key=f"save_meaning_{row_key}"):
                         if new_meaning:
-                            w["meaning"] = new_meaning
-                            save_words(words)
+                            update_meaning(w, new_meaning)
                             st.session_state[edit_key] = False
                             st.success("已更新！")
                             st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
@@ -496,14 +555,69 @@ def word_overview_page():
             else:
                 st.warning("確定要刪除這個單字嗎？")
                 if st.button("是", key=f"yes_del_{row_key}"):
-                    words.remove(w)
-                    save_words(words)
+                    remove_word(w)
                     st.session_state[confirm_del_key] = False
                     st.success("已刪除！")
                     st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
                 if st.button("否", key=f"no_del_{row_key}"):
                     st.session_state[confirm_del_key] = False
 
+# --------------------
+# 系統監控（只有 ADMIN_USERS 看得到）
+# --------------------
+def metrics_page():
+    st.title("系統監控")
+    metrics.enabled = st.checkbox("啟用量測", value=metrics.enabled, help="關閉時不計時也不計數")
+    snapshot = metrics.snapshot()
+    st.caption(f"自 {snapshot['since']} 起，整個 process 所有使用者合計")
+    timers = sorted(snapshot["timers"].items(), key=lambda item: -item[1]["total_ms"])
+    pages = [(name, t) for name, t in timers if name.startswith("page:")]
+    io_timers = [(name, t) for name, t in timers if not name.startswith("page:")]
+    if pages:
+        st.subheader("各頁面執行時間")
+        st.table([{
+            "頁面": name[len("page:"):],
+            "執行次數": t["count"],
+            "rerun 次數": snapshot["counters"].get(f"reruns:{name[len('page:'):]}", 0),
+            "平均毫秒": round(t["total_ms"] / t["count"], 2),
+            "最長毫秒": round(t["max_ms"], 2),
+        } for name, t in pages])
+    if io_timers:
+        st.subheader("讀寫計時")
+        st.table([{
+            "項目": name,
+            "次數": t["count"],
+            "總毫秒": round(t["total_ms"], 2),
+            "平均毫秒": round(t["total_ms"] / t["count"], 3),
+            "最長毫秒": round(t["max_ms"], 2),
+        } for name, t in io_timers])
+    status = persistence.status()
+    st.subheader("背景寫入")
+    st.table([{
+        "佇列中": status["depth"],
+        "容量": status["capacity"],
+        "最大深度": status["max_depth"],
+        "佇列滿而等待": status["waits"],
+        "寫入失敗": status["errors"],
+    }])
+    if status["last_error"]:
+        st.error(f"最後一次寫入失敗：{status['last_error']}")
+    counters = {k: v for k, v in snapshot["counters"].items() if not k.startswith("reruns:")}
+    if counters:
+        st.subheader("I/O 計數")
+        st.table([{"項目": k, "數值": v} for k, v in sorted(counters.items())])
+    if not timers and not counters:
+        st.info("目前還沒有量測資料，啟用量測後切換幾個頁面再回來看。")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("歸零"):
+            metrics.reset()
+            st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
+    with col2:
+        path = st.text_input("匯出檔案", value=METRICS_FILE or "metrics.json", key="metrics_export_path")
+        if st.button("匯出 JSON"):
+            st.success(f"已匯出到 {metrics.export(path)}")
+
 # --------------------
 # 主程式
 # --------------------
@@ -511,8 +625,6 @@ def main():
     # 初始化 Session State
     if "logged_in" not in st.session_state:
         st.session_state["logged_in"] = False
-    if "words" not in st.session_state:
-        st.session_state["words"] = load_today_words()
     # 側邊欄選單
     st.sidebar.title("背單字習慣追蹤系統")
     # 刪除側邊欄的清空所有單字按鈕
@@ -520,61 +632,56 @@ def main():
     #     clear_words()
     page = None
     if st.session_state["logged_in"]:
-        page = st.sidebar.radio("選擇頁面", ["首頁", "學習", "單字卡片", "單字總覽", "選擇題測驗", "分析報告", "複習"])
+        pages = ["首頁", "學習", "單字卡片", "單字總覽", "選擇題測驗", "分析報告", "複習"]
+        if st.session_state["current_user"] in ADMIN_USERS:
+            pages.append("系統監控")
+        page = st.sidebar.radio("選擇頁面", pages)
     else:
         login_page()
         return
-    if page == "首頁":
-        home_page()
-    elif page == "學習":
-        study_page()
-    elif page == "單字卡片":
-        word_cards_page()
-    elif page == "單字總覽":
-        word_overview_page()
-    elif page == "選擇題測驗":
-        quiz_page()
-    elif page == "分析報告":
-        stats_page()
-    elif page == "複習":
-        review_page()
+    user = st.session_state["current_user"]
+    metrics.incr(f"reruns:{page}")
+    # 以下所有讀寫都只碰目前使用者自己的資料夾
+    with acting_user(user):
+        init_user_session(user)
+        if page != "複習":
+            flush_review_changes()  # 離開複習頁就把暫存的評分寫回
+        maybe_flush_review_changes()
+        # 整頁的時間包含讀寫檔與畫元件，扣掉 I/O 計時就是畫面本身花的時間
+        with metrics.timer(f"page:{page}"):
+            if page == "首頁":
+                home_page()
+            elif page == "學習":
+                study_page()
+            elif page == "單字卡片":
+                word_cards_page()
+            elif page == "單字總覽":
+                word_overview_page()
+            elif page == "選擇題測驗":
+                quiz_page()
+            elif page == "分析報告":
+                stats_page()
+            elif page == "複習":
+                review_page()
+            elif page == "系統監控" and user in ADMIN_USERS:
+                metrics_page()
+    metrics.export_if_due()
 
 def clear_words():
     st.session_state["words"] = []
-    st.session_state["words_data"] = []
-    save_words([])  # 清空 words.json
+    replace_all_words([])  # 清空單字庫
     st.success("已清空所有單字資料！")
 
-def get_due_words(words):
-    """取得今天需要複習的單字（依level間隔），沒有 last_review 的單字也會出現"""
-    today = datetime.date.today()
-    level_days = {1: 1, 2: 3, 3: 7, 4: 13, 5: 21}
-    due_words = []
-    for w in words:
-        level = w.get("level", 1)
-        last = w.get("last_review")
-        if last is None:
-            # 沒有複習過的單字直接加入
-            due_words.append(w)
-            continue
-        last_date = datetime.datetime.strptime(last, "%Y-%m-%d").date()
-        interval = level_days.get(level, 1)
-        if (today - last_date).days >= interval and level < 5:
-            due_words.append(w)
-    return due_words
-
-def get_permanent_words(words):
-    """取得永久記憶區單字（level==5且已答對一次）"""
-    today = datetime.date.today()
-    level_days = {1: 1, 2: 3, 3: 7, 4: 13, 5: 21}
-    permanent = []
-    for w in words:
-        if w.get("level", 1) == 5:
-            last = w.get("last_review", today.isoformat())
-            last_date = datetime.datetime.strptime(last, "%Y-%m-%d").date()
-            if (today - last_date).days >= level_days[5]:
-                permanent.append(w)
-    return permanent
+# --------------------
+# 複習（排程邏輯在 word_engine）
+# --------------------
+def grade_review_word(word, remembered):
+    """評分後換上新版本的單字；寫檔交給 write-behind 暫存"""
+    w, old_level = grade_word(word, remembered)
+    if w is None:
+        return
+    st.session_state["level_change_msg"] = f"Level {old_level} → Level {w['level']}"
+    queue_review_change(review_event(w, remembered, old_level))
 
 def review_page():
     st.title("複習")
@@ -583,19 +690,15 @@ def review_page():
         ["複習單字區", "目前單字記憶狀況", "永久記憶區"],
         horizontal=True
     )
-    words = load_words()
-    due_words = get_due_words(words)
-    permanent = get_permanent_words(words)
-    level_words = {i: [] for i in range(1, 6)}
-    for w in words:
-        level = w.get("level", 1)
-        if level <= 5:
-            level_words[level].append(w["word"])
+    scheduler = get_review_scheduler()
 
     if tab == "複習單字區":
         st.subheader("複習單字區")
         if "review_queue" not in st.session_state or not st.session_state["review_queue"]:
-            st.session_state["review_queue"] = random.sample(due_words, len(due_words)) if due_words else []
+            with get_shared_vocab().lock:
+                due_words = scheduler.due_words()
+            # 佇列存當下的副本，作答後畫面上仍顯示原本的 level
+            st.session_state["review_queue"] = [dict(w) for w in random.sample(due_words, len(due_words))]
             st.session_state["review_idx"] = 0
             st.session_state["show_answer"] = False
             st.session_state["level_change_msg"] = ""
@@ -612,27 +715,11 @@ def review_page():
                 colA, colB = st.columns(2)
                 with colA:
                     if st.button("記得"):
-                        for w in words:
-                            if w["word"] == word_item["word"]:
-                                old_level = w.get("level", 1)
-                                new_level = min(old_level + 1, 5)
-                                w["level"] = new_level
-                                w["last_review"] = datetime.date.today().isoformat()
-                                st.session_state["level_change_msg"] = f"Level {old_level} → Level {new_level}"
-                                break
-                        save_words(words)
+                        grade_review_word(word_item["word"], remembered=True)
                         st.session_state["show_answer"] = True
                 with colB:
                     if st.button("忘記"):
-                        for w in words:
-                            if w["word"] == word_item["word"]:
-                                old_level = w.get("level", 1)
-                                new_level = max(old_level - 1, 1)
-                                w["level"] = new_level
-                                w["last_review"] = datetime.date.today().isoformat()
-                                st.session_state["level_change_msg"] = f"Level {old_level} → Level {new_level}"
-                                break
-                        save_words(words)
+                        grade_review_word(word_item["word"], remembered=False)
                         st.session_state["show_answer"] = True
             else:
                 st.info(f"中文意思：{word_item['meaning']}")
@@ -645,22 +732,26 @@ def review_page():
                     if st.session_state["review_idx"] >= len(st.session_state["review_queue"]):
                         st.session_state["review_queue"] = []
                         st.session_state["review_idx"] = 0
+                        flush_review_changes()
                         st.success("複習結束！")
 
     elif tab == "目前單字記憶狀況":
         st.subheader("目前單字記憶狀況")
+        level_words = level_breakdown()
         cols = st.columns(5)
         for i in range(1, 6):
             with cols[i-1]:
                 st.markdown(f"**● Level {i}**")
                 if level_words[i]:
-                    for word in level_words[i]:
-                        st.write(word)
+                    for w in level_words[i]:
+                        st.write(w["word"])
                 else:
                     st.write("—")
 
     elif tab == "永久記憶區":
         st.subheader("永久記憶區單字")
+        with get_shared_vocab().lock:
+            permanent = scheduler.permanent_words()
         if permanent:
             for w in permanent:
                 st.write(f"- {w['word']}：{w['meaning']}")
@@ -669,4 +760,5 @@ def review_page():
             st.write("請繼續努力！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 不開介面的工具（例如重建統計）請用 python word_engine.py
+    main()
@@ -0,0 +1,243 @@
+"""記憶分析（離線批次）：把作答紀錄、複習紀錄與單字庫讀成 pandas / NumPy 欄位，
+算出每個單字與每個 level 的保留率、遺忘時間估計與每日活動量，寫成一份報表快取給分析報告頁直接顯示。
+
+    python analytics.py              # 全部使用者，輸入沒變的就跳過
+    python analytics.py user1 --force
+
+報表記下產生時輸入的指紋（單字庫與各分段紀錄的大小、修改時間，以及報表期間每天學的單字），指紋沒變就不重算。
+分析報告頁只讀快取、不做計算，畫每日活動圖時才把最多 REPORT_DAYS 列轉成表格。
+"""
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import traceback
+
+import word_engine as engine
+
+ANALYTICS_REPORT_FILE = "analytics_report.json"
+REPORT_DAYS = 60  # 每日活動列出最近幾天
+REPORT_HARDEST_WORDS = 30
+MIN_WORD_EVENTS = 2  # 作答加複習至少幾次才列入最難單字
+
+# --------------------
+# 報表快取
+# --------------------
+def input_fingerprint():
+    """單字庫簽章、作答與複習紀錄各分段（含每月摘要）的大小與修改時間，加上報表期間每天學的單字。
+    每日新字存在統計檔的表裡，統計檔每次關閉連線都會變動，所以直接比內容（最多 REPORT_DAYS 天，很小）"""
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=REPORT_DAYS - 1)
+    parts = [list(engine.words_signature()), engine.load_words_between(start.isoformat(), today.isoformat())]
+    for name in (engine.LOG_NAME, engine.REVIEW_LOG_NAME):
+        for path in sorted(glob.glob(f"{glob.escape(engine.user_path(name))}.*.jsonl")):
+            stat = os.stat(path)
+            parts.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()
+
+def load_report():
+    return engine.read_json(engine.user_path(ANALYTICS_REPORT_FILE), None)
+
+def report_is_current(report):
+    return report is not None and report.get("fingerprint") == input_fingerprint()
+
+def refresh_report(force=False):
+    """輸入有變（或 force）才重算並寫回快取，回傳報表"""
+    engine.flush_persistence()  # 背景還沒寫完的作答與評分也算進去
+    fingerprint = input_fingerprint()  # 先取指紋：計算途中又有新資料，下次檢查就會再重算
+    report = load_report()
+    if not force and report is not None and report.get("fingerprint") == fingerprint:
+        return report
+    with engine.metrics.timer("analytics_build"):
+        report = build_report()
+    report["fingerprint"] = fingerprint
+    path = engine.user_path(ANALYTICS_REPORT_FILE)
+    with engine.file_lock(path):
+        engine.atomic_write_json(path, report)
+    return report
+
+_refreshing = {}  # 使用者資料夾 → 正在重算的執行緒
+_refresh_errors = {}
+_refresh_lock = threading.Lock()
+
+def refresh_report_async(user):
+    """在背景執行緒重算（不佔用寫檔的背景佇列），同一位使用者同時只跑一個；回傳這次有沒有啟動"""
+    with engine.acting_user(user):
+        directory = engine.user_dir()
+    with _refresh_lock:
+        thread = _refreshing.get(directory)
+        if thread is not None and thread.is_alive():
+            return False
+
+        def run():
+            try:
+                with engine.acting_user(user):
+                    refresh_report()
+                _refresh_errors.pop(directory, None)
+            except Exception as e:
+                _refresh_errors[directory] = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+
+        thread = _refreshing[directory] = threading.Thread(target=run, name=f"analytics-{user}", daemon=True)
+        thread.start()
+        return True
+
+def refresh_error():
+    """目前使用者上一次背景重算的錯誤訊息"""
+    return _refresh_errors.get(engine.user_dir())
+
+# --------------------
+# 計算（pandas / NumPy）
+# --------------------
+def _answer_frame(pd):
+    rows = [(engine.word_key(item["word"]), bool(item["is_correct"]), item.get("answered_at"))
+            for item in engine.get_answer_log()]
+    frame = pd.DataFrame(rows, columns=["key", "correct", "at"]).astype({"key": object, "correct": bool, "at": object})
+    frame["day"] = frame["at"].str[:10]
+    return frame
+
+def _review_frame(pd):
+    rows = [(item["key"], bool(item["remembered"]), int(item["old_level"]), item.get("reviewed_at"))
+            for item in engine.get_review_log()]
+    frame = pd.DataFrame(rows, columns=["key", "remembered", "old_level", "at"]).astype(
+        {"key": object, "remembered": bool, "old_level": "int64", "at": object})  # 沒有紀錄時欄位型別也要對
+    frame["at"] = pd.to_datetime(frame["at"], errors="coerce")
+    frame = frame.sort_values(["key", "at"], kind="stable")
+    # 距離同一個單字上一次複習幾天；第一次複習沒有上一次，記成 NaN
+    frame["interval"] = (frame["at"] - frame.groupby("key")["at"].shift()).dt.total_seconds() / 86400
+    frame["day"] = frame["at"].dt.strftime("%Y-%m-%d")
+    return frame
+
+def _counts(pd, frame, flag, older):
+    """逐筆紀錄（flag 欄是答對或記得）加上已壓縮月份的 (key, 次數, 答對或記得次數)，依 key 加總"""
+    recent = pd.DataFrame({"key": frame["key"], "n": 1, "ok": frame[flag].astype("int64")})
+    older = pd.DataFrame(older, columns=["key", "n", "ok"]).astype({"key": object, "n": "int64", "ok": "int64"})
+    return pd.concat([recent, older], ignore_index=True).groupby("key")[["n", "ok"]].sum()
+
+def _records(frame):
+    # NaN 換成 None，numpy 數值換成 Python 數值，才能寫成標準 JSON
+    frame = frame.astype(object).where(frame.notna(), None)
+    return [{k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()} for row in frame.to_dict("records")]
+
+def level_report(pd, np, reviews, summaries, words):
+    """依評分前 level 分組：複習次數、保留率、忘記前平均間隔、半衰期估計（R = 2^(-t/h)）"""
+    counts = reviews.groupby("old_level")["remembered"].agg(["count", "sum"])
+    for summary in summaries:
+        for level, (n, ok) in summary["levels"].items():
+            level = int(level)
+            if level in counts.index:
+                counts.loc[level] += (n, ok)
+            else:
+                counts.loc[level] = (n, ok)
+    levels = pd.DataFrame(index=pd.RangeIndex(1, engine.MAX_LEVEL + 1, name="level"))
+    levels["words"] = words["level"].value_counts().reindex(levels.index, fill_value=0) if len(words) else 0
+    levels["reviews"] = counts["count"].reindex(levels.index, fill_value=0)
+    levels["retention"] = counts["sum"].reindex(levels.index) / levels["reviews"].replace(0, np.nan)
+    timed = reviews.dropna(subset=["interval"])
+    grouped = timed.groupby("old_level")
+    levels["mean_interval_days"] = grouped["interval"].mean().reindex(levels.index)
+    forgot = timed[~timed["remembered"]].groupby("old_level")["interval"]
+    levels["median_days_to_forget"] = forgot.median().reindex(levels.index)
+    # 有間隔的複習裡記得的比例 r 與平均間隔 t，換算成保留率掉到一半要幾天
+    r = grouped["remembered"].mean().reindex(levels.index)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        half_life = levels["mean_interval_days"] * math.log(2) / -np.log(r)
+    levels["half_life_days"] = half_life.where((r > 0) & (r < 1))
+    return _records(levels.reset_index().round(3))
+
+def word_report(pd, answers, reviews, words, answer_summaries, review_summaries):
+    """每個單字的作答正確率與複習保留率（含已壓縮月份的摘要），取兩者平均最低的當作最難的單字"""
+    answered = _counts(pd, answers, "correct", [
+        (engine.word_key(word), n, n - wrong)
+        for s in answer_summaries for word, (n, wrong) in s["words"].items()
+    ])
+    reviewed = _counts(pd, reviews, "remembered", [
+        (key, n, ok) for s in review_summaries for key, (n, ok) in s.get("words", {}).items()  # 舊的摘要沒有依單字分
+    ])
+    table = pd.DataFrame({"attempts": answered["n"], "accuracy": answered["ok"] / answered["n"]}).join(
+        pd.DataFrame({"reviews": reviewed["n"], "retention": reviewed["ok"] / reviewed["n"],
+                      "forgets": reviewed["n"] - reviewed["ok"]}),
+        how="outer",
+    )
+    table[["attempts", "reviews", "forgets"]] = table[["attempts", "reviews", "forgets"]].fillna(0).astype(int)
+    table = table[table["attempts"] + table["reviews"] >= MIN_WORD_EVENTS]
+    table["score"] = table[["accuracy", "retention"]].mean(axis=1, skipna=True)
+    if len(words):
+        info = words.set_index("key")[["word", "meaning", "level"]]
+        table = table.join(info, how="left")
+    else:
+        table = table.assign(word=None, meaning=None, level=None)
+    table["word"] = table["word"].fillna(pd.Series(table.index, index=table.index))  # 已刪除的單字顯示 key
+    table = table.sort_values(["score", "attempts"], ascending=[True, False]).head(REPORT_HARDEST_WORDS)
+    return _records(table.reset_index(drop=True)[
+        ["word", "meaning", "level", "attempts", "accuracy", "reviews", "retention", "forgets", "score"]
+    ].round(3))
+
+def daily_report(pd, answers, reviews, today):
+    days = pd.date_range(end=today, periods=REPORT_DAYS).strftime("%Y-%m-%d")
+    daily = pd.DataFrame(index=pd.Index(days, name="day"))
+    by_answer = answers.groupby("day")["correct"].agg(["count", "sum"])
+    daily["answers"] = by_answer["count"].reindex(days, fill_value=0)
+    daily["correct"] = by_answer["sum"].reindex(days, fill_value=0)
+    by_review = reviews.groupby("day")["remembered"].agg(["count", "sum"])
+    daily["reviews"] = by_review["count"].reindex(days, fill_value=0)
+    daily["remembered"] = by_review["sum"].reindex(days, fill_value=0)
+    learned = engine.load_words_between(days[0], days[-1])
+    daily["new_words"] = pd.Series({day: len(ws) for day, ws in learned.items()}, dtype="int64").reindex(days, fill_value=0)
+    return _records(daily.reset_index())
+
+def build_report(today=None):
+    import numpy as np
+    import pandas as pd
+
+    today = today or datetime.date.today()
+    words = pd.DataFrame(engine.get_shared_vocab().current_words(), columns=["word", "meaning", "level", "last_review"])
+    words["key"] = words["word"].map(engine.word_key)
+    words["level"] = words["level"].fillna(1).astype(int)
+    answers = _answer_frame(pd)
+    reviews = _review_frame(pd)
+    answer_summaries = list(engine.get_answer_log().summaries().values())
+    review_summaries = list(engine.get_review_log().summaries().values())
+    return {
+        "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "totals": {
+            "words": len(words),
+            "answers": len(answers) + sum(s["total"] for s in answer_summaries),
+            "reviews": len(reviews) + sum(s["total"] for s in review_summaries),
+        },
+        "levels": level_report(pd, np, reviews, review_summaries, words),
+        "hardest_words": word_report(pd, answers, reviews, words, answer_summaries, review_summaries),
+        "daily": daily_report(pd, answers, reviews, today),
+    }
+
+def daily_frame(report):
+    """報表裡的每日活動轉成以日期為索引的表格（給長條圖用）"""
+    import pandas as pd
+
+    frame = pd.DataFrame(report["daily"]).set_index("day")
+    return frame.rename(columns={"answers": "作答", "reviews": "複習", "new_words": "新單字"})[["作答", "複習", "新單字"]]
+
+# --------------------
+# 命令列
+# --------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="背單字系統記憶分析（產生分析報告頁的報表快取）")
+    parser.add_argument("users", nargs="*", help="預設全部使用者")
+    parser.add_argument("--force", action="store_true", help="輸入沒變也重算")
+    args = parser.parse_args(argv)
+    for user in args.users or engine.known_users():
+        with engine.acting_user(user):
+            before = load_report()
+            report = refresh_report(force=args.force)
+        status = "unchanged" if report == before else "rebuilt"
+        totals = report["totals"]
+        print(f"{user}: {status} ({totals['words']} words, {totals['answers']} answers, {totals['reviews']} reviews)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""效能基準測試：產生 1k / 100k / 1M 規模的假資料，量測出題、複習、統計、打卡與存檔的時間與記憶體高峰。
+
+    python benchmark.py                       # 預設 1000 100000 1000000
+    python benchmark.py --sizes 1000 100000 --repeat 5 --json bench.json
+
+資料寫在暫存資料夾（或 --dir 指定的位置），不會碰到 data/ 底下的真實資料。
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import analytics
+import word_engine as engine
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+MEANING_CHARS = "蘋果香蕉櫻桃狗貓雞蛋書本學校老師朋友快樂悲傷天空海洋山河電腦手機時間工作"
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+HISTORY_DAYS = 365
+
+# --------------------
+# 假資料
+# --------------------
+def make_words(n, rng, today):
+    words = []
+    for i in range(n):
+        w = {
+            # 後面接流水號，保證不會撞 key
+            "word": "".join(rng.choice(LETTERS) for _ in range(rng.randint(3, 8))) + str(i),
+            "meaning": "".join(rng.choice(MEANING_CHARS) for _ in range(rng.randint(1, 4))),
+            "level": rng.randint(1, engine.MAX_LEVEL),
+            "last_review": (today - datetime.timedelta(days=rng.randint(0, 40))).isoformat(),
+        }
+        if rng.random() < 0.05:
+            w["last_review"] = None  # 還沒複習過的單字
+        words.append(w)
+    return words
+
+def _timestamp(rng, today):
+    day = today - datetime.timedelta(days=rng.randrange(HISTORY_DAYS))
+    return f"{day.isoformat()} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00"
+
+def write_dataset(directory, n, seed=0):
+    """在 directory 寫出 words.json、log.jsonl、checkin.jsonl、quiz_result.json，回傳單字清單"""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    os.makedirs(directory, exist_ok=True)
+    words = make_words(n, rng, today)
+    with open(os.path.join(directory, engine.WORDS_FILE), "w", encoding="utf-8") as f:
+        json.dump(words, f, ensure_ascii=False)
+    with open(os.path.join(directory, engine.LOG_FILE), "w", encoding="utf-8") as f:
+        for _ in range(n):
+            w = words[rng.randrange(n)]
+            correct = rng.random() < 0.7
+            f.write(json.dumps({
+                "word": w["word"],
+                "your_answer": w["meaning"] if correct else "?",
+                "correct_answer": w["meaning"],
+                "is_correct": correct,
+                "answered_at": _timestamp(rng, today),
+            }, ensure_ascii=False) + "\n")
+    users = ["user1", "user2", "admin"]
+    with open(os.path.join(directory, engine.CHECKIN_FILE), "w", encoding="utf-8") as f:
+        for _ in range(max(n // 10, 1)):
+            f.write(json.dumps({
+                "user": rng.choice(users),
+                "datetime": _timestamp(rng, today),
+                "type": "study",
+                "words_learned": [words[rng.randrange(n)]["word"] for _ in range(3)],
+            }, ensure_ascii=False) + "\n")
+    results = []
+    for _ in range(max(n // 100, 1)):
+        quiz_words = [words[rng.randrange(n)]["word"] for _ in range(10)]
+        wrong = quiz_words[:rng.randint(0, 3)]
+        accuracy = f"{round((10 - len(wrong)) * 10, 2)}%"
+        results.append({
+            "測驗時間": _timestamp(rng, today),
+            "題數": 10,
+            "正確率": accuracy,
+            "錯誤單字": ", ".join(wrong) if wrong else "無",
+            "單字列表": quiz_words,
+            "指紋": engine.quiz_fingerprint(10, accuracy, wrong, quiz_words),
+        })
+    with open(os.path.join(directory, engine.QUIZ_RESULT_FILE), "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False)
+    return words
+
+# --------------------
+# 量測
+# --------------------
+def measure(fn, repeat, memory):
+    """回傳 (最快一次的秒數, 記憶體高峰 bytes 或 None)；記憶體另外跑一次，不影響計時"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak
+
+def _open_history():
+    # 第一次取用時把 log.jsonl、quiz_result.json 拆成月份分段，並在背景壓縮保留期以前的月份
+    engine.get_answer_log()
+    engine.get_quiz_log()
+    engine.flush_persistence()
+
+def bench_cases(words):
+    """(名稱, 函式, 是否可重複執行)；只能跑一次的（首次匯入）只計一次"""
+    today = datetime.date.today()
+    cases = [
+        ("load_words (first open)", lambda: engine.get_shared_vocab().current_words(), False),
+        ("split + compact history", _open_history, False),
+        ("generate_choice_questions x10", lambda: engine.generate_choice_questions(words, 10), True),
+        ("distractor index build", lambda: engine.DistractorIndex(words), True),
+        ("choice questions (distractor index) x10",
+         lambda: engine.generate_choice_questions(words, 10, distractors=engine.get_word_derived("distractors")), True),
+        ("get_due_words", lambda: engine.get_due_words(words), True),
+        ("get_permanent_words", lambda: engine.get_permanent_words(words), True),
+        ("scheduler due (incremental)", lambda: engine.get_review_scheduler().due_words(today), True),
+        ("level breakdown", engine.level_breakdown, True),
+        ("stats rebuild from log", engine.rebuild_stats_rollup, True),
+        ("stats summary (stats_page)", engine.load_stats_summary, True),
+        ("analytics report build", analytics.build_report, True),
+        ("checkin streaks", lambda: engine.checkin_streaks(engine.get_checkin_log()), True),
+        ("load_quiz_results", engine.load_quiz_results, True),
+        ("save_words + reload", lambda: (engine.save_words(words), engine._read_words()), True),
+    ]
+    if engine._numpy():
+        cases.insert(8, ("columns due (incremental)", lambda: engine.get_word_columns().due_words(today), True))
+    return cases
+
+def run_size(base_dir, n, repeat, memory):
+    user = f"bench_{n}"
+    words = write_dataset(os.path.join(base_dir, user), n)
+    rows = []
+    with engine.acting_user(user):
+        # 第一次開啟會把 words.json 匯入 SQLite，之後的量測都從共用快照拿資料
+        for name, fn, repeatable in bench_cases(words):
+            elapsed, peak = measure(fn, repeat if repeatable else 1, memory and repeatable)
+            rows.append({"size": n, "case": name, "seconds": elapsed, "peak_bytes": peak})
+            print(_format_row(rows[-1]), flush=True)
+    return rows
+
+def _format_row(row):
+    peak = "-" if row["peak_bytes"] is None else f"{row['peak_bytes'] / 2 ** 20:9.1f} MiB"
+    return f"{row['size']:>9,}  {row['case']:<40} {row['seconds'] * 1000:>11.2f} ms  {peak:>13}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="背單字系統效能基準測試")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="單字數量（作答紀錄同數量）")
+    parser.add_argument("--repeat", type=int, default=3, help="每項重複幾次取最快")
+    parser.add_argument("--backend", choices=["sqlite", "json"], default=engine.WORDS_BACKEND)
+    parser.add_argument("--no-memory", action="store_true", help="不量記憶體高峰（tracemalloc 會多跑一次而且比較慢）")
+    parser.add_argument("--dir", help="假資料放哪裡，預設用暫存資料夾並在結束後刪除")
+    parser.add_argument("--json", help="結果另外寫成 JSON，方便比對前後版本")
+    args = parser.parse_args(argv)
+
+    engine.WORDS_BACKEND = args.backend
+    with tempfile.TemporaryDirectory(prefix="lkk_bench_") as tmp:
+        engine.DATA_DIR = args.dir or tmp
+        print(f"backend={args.backend} python={sys.version.split()[0]} data={engine.DATA_DIR}")
+        print(f"{'size':>9}  {'case':<40} {'time':>14}  {'peak memory':>13}")
+        rows = []
+        for n in args.sizes:
+            rows.extend(run_size(engine.DATA_DIR, n, args.repeat, not args.no_memory))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "results": rows}, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+"""多人同時使用的壓力測試：用 Streamlit 的 AppTest 在背景跑 0524.py，模擬很多位學習者同時登入、
+新增單字、做選擇題測驗與複習，統計每種動作的延遲百分位數、吞吐量與檔案競爭造成的錯誤。
+
+    python loadtest.py                                  # 預設 20 個 session、8 個 thread
+    python loadtest.py --sessions 100 --workers 16 --mode process --seed-words 500 --json load.json
+
+每個 session 依序用 FAKE_USERS 裡的帳號登入，同一個帳號的 session 會搶同一個資料夾。
+資料寫在暫存資料夾（或 --dir 指定的位置），不會碰到 data/ 底下的真實資料。
+thread 模式所有 session 共用一個 process（跟一台 Streamlit server 一樣）；process 模式則像多台 server 共用磁碟。
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import sys
+import multiprocessing
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "0524.py")
+PERCENTILES = (50, 90, 95, 99)
+# AppTest 執行時會替換 Streamlit 的全域 Runtime 與設定，同一個 process 裡不能同時跑兩個；
+# thread 模式的重新執行因此一次一個（排隊時間算在延遲裡，跟 GIL 下的 server 差不多），
+# 背景寫入與檔案鎖仍然跟其他 session 交錯。要看真正平行的情況用 process 模式
+APPTEST_LOCK = threading.Lock()
+# 錯誤訊息裡出現這些字，就算是多個 session 搶同一份檔案造成的
+CONTENTION_MARKERS = (
+    "database is locked", "database table is locked", "Resource temporarily unavailable",
+    "BlockingIOError", "JSONDecodeError", "FileNotFoundError",
+)
+
+# --------------------
+# 模擬一位學習者
+# --------------------
+def fake_users(app_file=APP_FILE):
+    """直接從原始碼讀 FAKE_USERS，不必執行介面"""
+    with open(app_file, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "FAKE_USERS" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"FAKE_USERS not found in {app_file}")
+
+class SessionError(Exception):
+    pass
+
+class LearnerSession:
+    """一個瀏覽器分頁：每個動作是一次（或幾次）重新執行，記下花的時間與錯誤"""
+
+    def __init__(self, index, user, password, options):
+        from streamlit.testing.v1 import AppTest  # process 模式在子 process 裡才載入
+
+        self.index = index
+        self.user = user
+        self.password = password
+        self.options = options
+        self.rng = random.Random(options["seed"] + index)
+        self.at = AppTest.from_file(options["app"], default_timeout=options["timeout"])
+        self.records = []
+
+    def _timed(self, action, fn):
+        start = time.perf_counter()
+        error = None
+        try:
+            fn()
+            if self.at.exception:
+                error = "\n".join(e.message for e in self.at.exception)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if self.options["verbose"]:
+                traceback.print_exc()
+        self.records.append({"action": action, "seconds": time.perf_counter() - start, "error": error})
+        if error:
+            raise SessionError(error)
+
+    def _rerun(self):
+        with APPTEST_LOCK:
+            self.at.run()
+
+    def _click(self, label):
+        buttons = [b for b in self.at.button if b.label == label]
+        if not buttons:
+            raise SessionError(f"no button {label!r} on page")
+        buttons[0].click()
+        self._rerun()
+
+    def _has_button(self, label):
+        return any(b.label == label for b in self.at.button)
+
+    def _goto(self, page):
+        def go():
+            self.at.sidebar.radio[0].set_value(page)
+            self._rerun()
+        self._timed(f"page:{page}", go)
+
+    def login(self):
+        self._timed("open", self._rerun)
+
+        def submit():
+            self.at.text_input(key="login_username").input(self.user)
+            self.at.text_input(key="login_password").input(self.password)
+            self._click("登入")
+            self._rerun()  # 登入成功那次還在畫登入頁，下一次才會出現側邊欄
+        self._timed("login", submit)
+
+    def add_words(self):
+        self._goto("學習")
+        for i in range(self.options["words"]):
+            def add(i=i):
+                self.at.text_input[0].input(f"load{self.index}x{i}")
+                self.at.text_input[1].input(f"壓測{self.index}之{i}")
+                self._click("新增單字")
+            self._timed("add_word", add)
+
+    def take_quiz(self):
+        self._goto("選擇題測驗")
+        if self._has_button("重新開始"):  # 還停在上一次測驗的結果畫面
+            self._timed("quiz_restart", lambda: self._click("重新開始"))
+        if not self._has_button("開始測驗"):
+            return
+        self._timed("quiz_start", lambda: self._click("開始測驗"))
+        while True:
+            radios = [r for r in self.at.radio if r.label == "請選擇正確意思："]
+            if not radios or not self._has_button("提交答案"):
+                break
+
+            def answer(radio=radios[0]):
+                radio.set_value(self.rng.choice(radio.options))
+                self._click("提交答案")
+            self._timed("quiz_answer", answer)
+            self._timed("quiz_next", self._rerun)
+
+    def review(self):
+        self._goto("複習")
+        for _ in range(self.options["reviews"]):
+            if not self._has_button("記得"):
+                break
+            self._timed("review_grade", lambda: self._click(self.rng.choice(["記得", "忘記"])))
+            # 評分那次還畫著評分按鈕，下一次才顯示意思與「下一題」
+            self._timed("review_answer", self._rerun)
+            if not self._has_button("下一題"):
+                break
+
+            def next_word():
+                self._click("下一題")
+                self._rerun()  # 同上，按下一題那次還沒畫出下一個單字
+            self._timed("review_next", next_word)
+
+    def run(self):
+        try:
+            self.login()
+            self.add_words()
+            for _ in range(self.options["quizzes"]):
+                self.take_quiz()
+            self.review()
+            self._goto("分析報告")  # 讀統計前會等背景寫入，最容易看出寫入塞車
+            self._goto("首頁")  # 離開複習頁時寫回暫存的評分
+        except SessionError:
+            pass  # 已經記在 records，這個 session 不再往下做
+        return self.records
+
+def run_sessions(batch, options):
+    """依序跑一批 (編號, 帳號, 密碼)，每個 session 回傳一筆結果"""
+    results = []
+    for index, user, password in batch:
+        records = LearnerSession(index, user, password, options).run()
+        results.append({"records": records, "pid": os.getpid(), "persistence": _persistence_status()})
+    return results
+
+def _persistence_status():
+    engine = sys.modules.get("word_engine")
+    if engine is None:
+        return None
+    engine.flush_persistence()
+    return engine.persistence.status()
+
+# --------------------
+# 準備資料與環境
+# --------------------
+def prepare_environment(work_dir):
+    """切到暫存資料夾，讓介面的資料與根目錄舊資料的搬移都只發生在這裡"""
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+    os.environ["LKK_DATA_DIR"] = os.path.join(work_dir, "data")
+
+def seed_words(work_dir, users, n, seed):
+    """每個帳號先放 n 個單字（舊版 words.json 格式，第一次開啟時匯入），測驗與複習才有題目"""
+    if n <= 0:
+        return
+    import datetime
+    from benchmark import make_words
+
+    for user in users:
+        directory = os.path.join(work_dir, "data", user)
+        os.makedirs(directory, exist_ok=True)
+        words = make_words(n, random.Random(f"{seed}:{user}"), datetime.date.today())
+        with open(os.path.join(directory, "words.json"), "w", encoding="utf-8") as f:
+            json.dump(words, f, ensure_ascii=False)
+
+# --------------------
+# 統計
+# --------------------
+def percentile(sorted_values, p):
+    # nearest-rank
+    if not sorted_values:
+        return None
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def classify_error(message):
+    return "contention" if any(m in message for m in CONTENTION_MARKERS) else "app"
+
+def summarize(results, wall_seconds, sessions):
+    by_action = {}
+    errors = {"contention": 0, "app": 0}
+    samples = []
+    failed_sessions = 0
+    for result in results:
+        records = result["records"]
+        if records and records[-1]["error"]:
+            failed_sessions += 1
+        for r in records:
+            by_action.setdefault(r["action"], []).append(r["seconds"])
+            if r["error"]:
+                errors[classify_error(r["error"])] += 1
+                if len(samples) < 5:
+                    samples.append(f"{r['action']}: {r['error'].splitlines()[0][:200]}")
+    actions = {}
+    for action, values in sorted(by_action.items()):
+        values.sort()
+        actions[action] = {
+            "count": len(values),
+            **{f"p{p}": percentile(values, p) for p in PERCENTILES},
+            "max": values[-1],
+        }
+    # 每個 process 只算最後一次回報的背景寫入狀態
+    persist = {}
+    for result in results:
+        if result["persistence"] is not None:
+            persist[result["pid"]] = result["persistence"]
+    total_actions = sum(a["count"] for a in actions.values())
+    return {
+        "sessions": sessions,
+        "failed_sessions": failed_sessions,
+        "wall_seconds": wall_seconds,
+        "actions_per_second": total_actions / wall_seconds if wall_seconds else None,
+        "sessions_per_second": sessions / wall_seconds if wall_seconds else None,
+        "actions": actions,
+        "errors": errors,
+        "error_samples": samples,
+        "persist_errors": sum(s["errors"] for s in persist.values()),
+        "persist_max_depth": max((s["max_depth"] for s in persist.values()), default=0),
+        "persist_waits": sum(s["waits"] for s in persist.values()),
+    }
+
+def print_report(report):
+    print(f"{'action':<22}{'count':>7}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES) + f"{'max':>10}")
+    for action, a in report["actions"].items():
+        print(f"{action:<22}{a['count']:>7}" + "".join(f"{a['p' + str(p)] * 1000:>8.1f}ms" for p in PERCENTILES)
+              + f"{a['max'] * 1000:>8.1f}ms")
+    print(f"sessions {report['sessions']} (failed {report['failed_sessions']}) in {report['wall_seconds']:.1f}s, "
+          f"{report['actions_per_second']:.1f} actions/s, {report['sessions_per_second']:.2f} sessions/s")
+    print(f"errors: contention {report['errors']['contention']}, app {report['errors']['app']}; "
+          f"background writes: errors {report['persist_errors']}, max queue depth {report['persist_max_depth']}, "
+          f"full-queue waits {report['persist_waits']}")
+    for sample in report["error_samples"]:
+        print(f"  {sample}")
+
+# --------------------
+# 執行
+# --------------------
+def run_load(options, users, sessions, workers, mode):
+    accounts = [(u, users[u]) for u in options["users"]]
+    plan = [(i, *accounts[i % len(accounts)]) for i in range(sessions)]
+    results = []
+    if mode == "thread":
+        pool = ThreadPoolExecutor(max_workers=workers)
+        batches = [[item] for item in plan]
+    else:
+        # 用 spawn 開新的 process，不繼承主 process 裡已經啟動的背景寫入執行緒。
+        # AppTest 會把 __main__ 換成介面腳本，之後就找不到這個模組的函式，所以每個 process 只接一批
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   max_tasks_per_child=1)
+        batches = [plan[k::workers] for k in range(workers) if plan[k::workers]]
+    start = time.perf_counter()
+    with pool:
+        futures = [pool.submit(run_sessions, batch, options) for batch in batches]
+        for future in as_completed(futures):
+            results.extend(future.result())
+            if options["verbose"]:
+                print(f"  {len(results)}/{sessions} sessions done", flush=True)
+    return results, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="背單字系統多人同時使用壓力測試")
+    parser.add_argument("--sessions", type=int, default=20, help="總共模擬幾個 session")
+    parser.add_argument("--workers", type=int, default=8, help="同時進行的 session 數")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--users", nargs="+", help="只用這些帳號，預設 FAKE_USERS 全部")
+    parser.add_argument("--words", type=int, default=3, help="每個 session 新增幾個單字")
+    parser.add_argument("--quizzes", type=int, default=1, help="每個 session 做幾次測驗")
+    parser.add_argument("--reviews", type=int, default=5, help="每個 session 最多複習幾個單字")
+    parser.add_argument("--seed-words", type=int, default=50, help="每個帳號事先放幾個單字")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60, help="每次重新執行最多等幾秒")
+    parser.add_argument("--app", default=APP_FILE)
+    parser.add_argument("--dir", help="資料放哪裡，預設用暫存資料夾並在結束後刪除")
+    parser.add_argument("--json", help="結果另外寫成 JSON，方便比對前後版本")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    users = fake_users(args.app)
+    unknown = set(args.users or ()) - set(users)
+    if unknown:
+        parser.error(f"unknown users: {', '.join(sorted(unknown))}")
+    options = {
+        "app": os.path.abspath(args.app),
+        "users": args.users or list(users),
+        "words": args.words,
+        "quizzes": args.quizzes,
+        "reviews": args.reviews,
+        "seed": args.seed,
+        "timeout": args.timeout,
+        "verbose": args.verbose,
+    }
+    json_path = os.path.abspath(args.json) if args.json else None
+    sys.path.insert(0, os.path.dirname(options["app"]))  # 讓介面找得到 word_engine
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="lkk_load_") as tmp:
+        work_dir = os.path.abspath(args.dir or tmp)
+        prepare_environment(work_dir)
+        try:
+            seed_words(work_dir, options["users"], args.seed_words, args.seed)
+            print(f"mode={args.mode} sessions={args.sessions} workers={args.workers} "
+                  f"users={','.join(options['users'])} data={work_dir}", flush=True)
+            results, wall = run_load(options, users, args.sessions, args.workers, args.mode)
+        finally:
+            os.chdir(cwd)
+    report = summarize(results, wall, args.sessions)
+    report["mode"] = args.mode
+    report["workers"] = args.workers
+    print_report(report)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["errors"]["contention"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import word_engine as engine  # noqa: E402
+
+@pytest.fixture
+def user(tmp_path, monkeypatch):
+    """每個測試一個乾淨的資料夾；背景寫入改成當場執行，測試裡讀得到剛寫的資料"""
+    monkeypatch.setattr(engine, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(engine.persistence, "sync", True)
+    with engine.acting_user("tester"):
+        engine.get_shared_vocab().current_words()
+        yield "tester"
+    engine._resources.clear()
+    engine._review_buffers.clear()
@@ -0,0 +1,98 @@
+"""離線分析報表：統計數字與報表快取的輸入指紋"""
+import datetime
+import json
+import os
+
+import pytest
+
+import analytics
+import word_engine as engine
+
+pytest.importorskip("pandas")
+
+def _answer(word, ok, when):
+    return {"word": word, "your_answer": "?", "correct_answer": "?", "is_correct": ok, "answered_at": when}
+
+def _review(key, remembered, old_level, when):
+    return {"key": key, "remembered": remembered, "old_level": old_level, "reviewed_at": when}
+
+def _at(days_ago, hour=10):
+    return f"{datetime.date.today() - datetime.timedelta(days=days_ago)} {hour:02d}:00:00"
+
+def _by(rows, field):
+    return {row[field]: row for row in rows}
+
+def test_build_report_totals_levels_and_daily(user):
+    engine.replace_all_words([
+        {"word": "apple", "meaning": "蘋果", "level": 2, "last_review": None},
+        {"word": "pear", "meaning": "梨", "level": 1, "last_review": None},
+        {"word": "kiwi", "meaning": "奇異果", "level": 1, "last_review": None},
+    ])
+    for item in [_answer("Apple", True, _at(0)), _answer("apple", False, _at(0)), _answer("apple", False, _at(0)),
+                 _answer("pear", True, _at(1)), _answer("pear", True, _at(1))]:
+        engine.get_answer_log().append(item)
+    for item in [_review("apple", False, 2, _at(3)), _review("apple", True, 1, _at(0)), _review("pear", True, 1, _at(0))]:
+        engine.get_review_log().append(item)
+    engine.save_today_words(["kiwi"])
+
+    report = analytics.build_report()
+    assert report["totals"] == {"words": 3, "answers": 5, "reviews": 3}
+
+    levels = _by(report["levels"], "level")
+    assert {level: row["reviews"] for level, row in levels.items()} == {1: 2, 2: 1, 3: 0, 4: 0, 5: 0}
+    assert {level: row["words"] for level, row in levels.items()} == {1: 2, 2: 1, 3: 0, 4: 0, 5: 0}
+    assert levels[1]["retention"] == 1.0
+    assert levels[1]["mean_interval_days"] == 3.0  # apple 隔三天再複習，pear 只複習過一次
+    assert levels[3]["retention"] is None
+
+    hardest = report["hardest_words"]
+    assert hardest[0]["word"] == "apple"
+    assert (hardest[0]["attempts"], hardest[0]["accuracy"], hardest[0]["reviews"], hardest[0]["forgets"]) == (3, 0.333, 2, 1)
+
+    daily = _by(report["daily"], "day")
+    assert len(daily) == analytics.REPORT_DAYS
+    today = daily[datetime.date.today().isoformat()]
+    assert (today["answers"], today["correct"], today["reviews"], today["remembered"], today["new_words"]) == (3, 1, 2, 2, 1)
+
+def test_refresh_report_reuses_cache_until_inputs_change(user):
+    engine.add_or_update_word("apple", "蘋果")
+    engine.get_answer_log().append(_answer("apple", True, _at(0)))
+    report = analytics.refresh_report()
+    assert analytics.report_is_current(analytics.load_report())
+    assert analytics.refresh_report() == report  # 輸入沒變直接讀快取
+
+    engine.get_answer_log().append(_answer("apple", False, _at(0)))
+    assert not analytics.report_is_current(analytics.load_report())
+    report = analytics.refresh_report()
+    assert report["totals"]["answers"] == 2
+    assert analytics.report_is_current(report)
+
+    engine.add_or_update_word("pear", "梨")
+    assert not analytics.report_is_current(report)
+    assert analytics.refresh_report()["totals"]["words"] == 2
+
+    report = analytics.refresh_report()
+    engine.save_today_words(["apple", "pear"])  # 每日新字只寫進統計檔的表
+    assert not analytics.report_is_current(report)
+    assert analytics.refresh_report()["daily"][-1]["new_words"] == 2
+
+def test_hardest_words_count_compacted_months(user):
+    engine.add_or_update_word("apple", "蘋果")
+    engine.add_or_update_word("pear", "梨")
+    old = engine.month_shift(engine.current_month(), -engine.HISTORY_KEEP_MONTHS - 1)
+    with open(engine.user_path(engine.LOG_FILE), "w", encoding="utf-8") as f:
+        for i in range(6):
+            f.write(json.dumps(_answer("Apple", i == 0, f"{old}-0{i + 1} 10:00:00")) + "\n")
+        for _ in range(2):
+            f.write(json.dumps(_answer("pear", True, _at(0))) + "\n")
+    with open(engine.user_path(f"{engine.REVIEW_LOG_NAME}.{old}.jsonl"), "w", encoding="utf-8") as f:
+        for i in range(3):
+            f.write(json.dumps(_review("apple", False, 2, f"{old}-0{i + 1} 10:00:00")) + "\n")
+    engine.get_answer_log()
+    engine.get_review_log()  # 第一次開啟時把舊月份壓縮成摘要
+    assert not os.path.exists(engine.user_path(f"{engine.REVIEW_LOG_NAME}.{old}.jsonl"))
+
+    report = analytics.build_report()
+    assert report["totals"] == {"words": 2, "answers": 8, "reviews": 3}
+    apple = _by(report["hardest_words"], "word")["apple"]
+    assert (apple["attempts"], apple["accuracy"], apple["reviews"], apple["forgets"]) == (6, 0.167, 3, 3)
@@ -0,0 +1,39 @@
+"""單字的匯入／匯出（CSV、TSV、JSONL）"""
+import io
+
+import pytest
+
+import word_engine as engine
+
+ROUND_TRIP_WORDS = [
+    {"word": "apple", "meaning": "蘋果, 紅色的", "level": 3, "last_review": "2026-01-02"},
+    {"word": "pear", "meaning": '梨"子"', "level": 5, "last_review": None},
+    {"word": "tab", "meaning": "定位\t鍵", "level": 1, "last_review": "2025-12-31"},
+]
+
+@pytest.mark.parametrize("fmt", ["csv", "tsv", "jsonl"])
+def test_export_import_round_trip(user, fmt):
+    out = io.StringIO()
+    assert engine.export_words(out, fmt, ROUND_TRIP_WORDS) == len(ROUND_TRIP_WORDS)
+    counts = engine.import_words(io.StringIO(out.getvalue()), fmt)
+    assert counts == {"added": 3, "updated": 0, "skipped": 0, "invalid": 0}
+    assert engine.get_words() == ROUND_TRIP_WORDS
+    assert engine._read_words() == ROUND_TRIP_WORDS  # 也真的寫進單字庫
+
+@pytest.mark.parametrize("policy, meaning, counts", [
+    ("skip", "蘋果", {"added": 1, "updated": 0, "skipped": 1, "invalid": 1}),
+    ("overwrite", "蘋果公司", {"added": 1, "updated": 1, "skipped": 0, "invalid": 1}),
+    ("append", "蘋果；蘋果公司", {"added": 1, "updated": 1, "skipped": 0, "invalid": 1}),
+])
+def test_import_policies(user, policy, meaning, counts):
+    engine.replace_all_words([{"word": "apple", "meaning": "蘋果", "level": 4, "last_review": "2026-01-02"}])
+    data = "word,meaning\nApple,蘋果公司\nkiwi,奇異果\n,沒有單字\n"
+    assert engine.import_words(io.StringIO(data), "csv", policy) == counts
+    apple = engine.find_word("apple")
+    assert apple["meaning"] == meaning
+    assert (apple["level"], apple["last_review"]) == (4, "2026-01-02")  # 既有單字的進度不動
+    assert engine.find_word("kiwi")["meaning"] == "奇異果"
+
+def test_import_rejects_unknown_policy(user):
+    with pytest.raises(ValueError):
+        engine.import_words(io.StringIO("apple,蘋果\n"), "csv", "replace")
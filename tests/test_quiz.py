@@ -0,0 +1,62 @@
+"""測驗進度：只存種子、單字 key 與作答編號，重新產生的題目要跟第一次看到的一樣"""
+import os
+import random
+
+from test_scheduler import make_words
+
+import word_engine as engine
+
+def test_quiz_questions_regenerate_after_restart(user):
+    engine.replace_all_words(make_words(50, random.Random(23)))
+    state = engine.new_quiz(engine.get_words(), 10, random.Random(3))
+    before = [engine.quiz_question(state, i) for i in range(10)]
+    assert [q["word"] for q in before] == [engine.find_word(k)["word"] for k in state["keys"]]
+    for q in before:
+        assert len(set(q["options"])) == len(q["options"])
+        assert q["options"][q["answer_index"]] == engine.find_word(q["word"])["meaning"]
+    engine._resources.clear()  # 模擬重新啟動
+    engine.get_shared_vocab().current_words()
+    assert [engine.quiz_question(state, i) for i in range(10)] == before
+
+def test_answer_quiz_scores_and_skips(user):
+    engine.replace_all_words(make_words(20, random.Random(19)))
+    state = engine.new_quiz(engine.get_words(), 3, random.Random(2))
+    question = engine.quiz_question(state, 0)
+    state, _, correct = engine.answer_quiz(state, question["answer_index"])
+    assert correct
+    state, _, correct = engine.answer_quiz(state, (engine.quiz_question(state, 1)["answer_index"] + 1) % 4)
+    assert not correct
+    state, _, _ = engine.answer_quiz(state, None)
+    assert engine.quiz_done(state)
+    assert engine.quiz_score(state) == (1, 2, [state["keys"][1]])
+
+def test_quiz_state_saved_until_done(user):
+    engine.replace_all_words(make_words(20, random.Random(29)))
+    assert engine.new_quiz(engine.get_words()[:1], 5) is None  # 只有一個單字出不了選擇題
+    state = engine.new_quiz(engine.get_words(), 2, random.Random(4))
+    engine.save_quiz_state(state)
+    assert engine.load_quiz_state() == state
+
+    state, _, _ = engine.answer_quiz(state, 0)
+    state, _, _ = engine.answer_quiz(state, 1)
+    engine.save_quiz_state(state)
+    assert engine.load_quiz_state() is None  # 做完的測驗不再接續
+    engine.save_quiz_state(None)
+    assert not os.path.exists(engine.user_path(engine.QUIZ_STATE_FILE))
+
+def test_resumed_quiz_shows_same_options(user):
+    engine.replace_all_words(make_words(150, random.Random(17)))
+    state = engine.new_quiz(engine.get_words(), 10, random.Random(1))
+    before = [engine.quiz_question(state, i) for i in range(10)]
+    # 複習別的單字（level 改變會搬動干擾選項索引的分組），再模擬重新啟動
+    events = []
+    for w in engine.get_words()[:60]:
+        if engine.word_key(w["word"]) not in state["keys"]:
+            old_level = w["level"]
+            graded, _ = engine.grade_word(w["word"], old_level < engine.MAX_LEVEL)
+            events.append(engine.review_event(graded, True, old_level))
+    engine.persist_review_updates(events, events=events)
+    assert [engine.quiz_question(state, i) for i in range(10)] == before
+    engine._resources.clear()
+    engine.get_shared_vocab().current_words()
+    assert [engine.quiz_question(state, i) for i in range(10)] == before
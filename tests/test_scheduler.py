@@ -0,0 +1,214 @@
+"""複習排程、單字索引與搜尋：跟原本逐一掃描的寫法對照，增量維護的結果要跟重新建立的一樣"""
+import datetime
+import io
+import json
+import random
+
+import pytest
+
+import word_engine as engine
+
+MEANING_CHARS = "蘋果香蕉櫻桃狗貓雞蛋書本學校老師朋友"
+
+def make_words(n, rng):
+    today = datetime.date.today()
+    words = []
+    for i in range(n):
+        level = rng.randint(1, engine.MAX_LEVEL)
+        last = today - datetime.timedelta(days=rng.randint(0, 30))
+        words.append({
+            "word": f"w{i:03d}" + "abc"[:rng.randint(0, 3)],
+            "meaning": "".join(rng.choice(MEANING_CHARS) for _ in range(rng.randint(1, 3))),
+            "level": level,
+            # 原本的寫法遇到 level 5 卻沒有複習日期的單字會出錯，對照資料不產生這種情況
+            "last_review": None if level < engine.MAX_LEVEL and rng.random() < 0.1 else last.isoformat(),
+        })
+    return words
+
+def _keys(words):
+    return sorted(engine.word_key(w["word"]) for w in words)
+
+def _distractor_groups(index):
+    # 每個 _KeyBag 的位置表都要跟清單一致，比較時只看集合內容（順序會因刪除而不同）
+    for bag in index._groups.values():
+        assert len(bag.keys) == len(bag.pos)
+        assert all(bag.keys[i] == key for key, i in bag.pos.items())
+    return index._entries, {g: set(bag.keys) for g, bag in index._groups.items()}
+
+# --------------------
+# 複習排程：跟原本 0524.py 逐一掃描的寫法對照
+# --------------------
+def baseline_due_words(words, today):
+    level_days = {1: 1, 2: 3, 3: 7, 4: 13, 5: 21}
+    due_words = []
+    for w in words:
+        level = w.get("level", 1)
+        last = w.get("last_review")
+        if last is None:
+            due_words.append(w)
+            continue
+        last_date = datetime.datetime.strptime(last, "%Y-%m-%d").date()
+        interval = level_days.get(level, 1)
+        if (today - last_date).days >= interval and level < 5:
+            due_words.append(w)
+    return due_words
+
+def baseline_permanent_words(words, today):
+    permanent = []
+    for w in words:
+        if w.get("level", 1) == 5:
+            last = w.get("last_review", today.isoformat())
+            last_date = datetime.datetime.strptime(last, "%Y-%m-%d").date()
+            if (today - last_date).days >= 21:
+                permanent.append(w)
+    return permanent
+
+def test_due_and_permanent_match_baseline():
+    words = make_words(500, random.Random(1))
+    scheduler = engine.ReviewScheduler(words)
+    today = datetime.date.today()
+    for day in (today + datetime.timedelta(days=d) for d in (0, 1, 3, 7, 13, 21, 45)):
+        assert _keys(scheduler.due_words(day)) == _keys(baseline_due_words(words, day))
+        assert _keys(scheduler.permanent_words(day)) == _keys(baseline_permanent_words(words, day))
+    assert _keys(engine.get_due_words(words)) == _keys(baseline_due_words(words, today))
+    assert _keys(engine.get_permanent_words(words)) == _keys(baseline_permanent_words(words, today))
+    if engine._numpy():
+        columns = engine.WordColumns(words)
+        for day in (today, today + datetime.timedelta(days=21)):
+            assert _keys(columns.due_words(day)) == _keys(baseline_due_words(words, day))
+            assert _keys(columns.permanent_words(day)) == _keys(baseline_permanent_words(words, day))
+
+def test_grade_word_moves_level_within_bounds(user):
+    engine.replace_all_words([
+        {"word": "apple", "meaning": "蘋果", "level": 5, "last_review": "2026-01-02"},
+        {"word": "pear", "meaning": "梨", "level": 1, "last_review": "2026-01-02"},
+    ])
+    assert engine.grade_word("apple", True)[0]["level"] == 5
+    assert engine.grade_word("pear", False)[0]["level"] == 1
+    w, old_level = engine.grade_word("Apple", False)
+    assert (w["level"], old_level, w["last_review"]) == (4, 5, datetime.date.today().isoformat())
+    assert engine.grade_word("missing", True) == (None, None)
+
+# --------------------
+# 單字索引與搜尋
+# --------------------
+def test_find_word_ignores_case_and_spaces(user):
+    engine.add_or_update_word("Apple", "蘋果")
+    assert engine.find_word("  apple ")["word"] == "Apple"
+    engine.add_or_update_word("APPLE", "蘋果公司")
+    assert [(w["word"], w["meaning"]) for w in engine.get_words()] == [("Apple", "蘋果公司")]
+    assert engine.find_word("pear") is None
+
+def test_search_by_prefix_and_meaning(user):
+    engine.replace_all_words([
+        {"word": w, "meaning": m, "level": 1, "last_review": None}
+        for w, m in [("apple", "蘋果"), ("Application", "應用程式"), ("pineapple", "鳳梨"), ("banana", "香蕉")]
+    ])
+    assert engine.search_word_keys("APP", 0) == (["apple", "application"], 2)
+    assert engine.search_word_keys("", 1, page_size=3) == (["pineapple"], 4)
+    assert engine.search_word_keys("果", 0) == (["apple"], 1)
+    assert engine.search_word_keys("程式", 0) == (["application"], 1)
+    assert engine.search_word_keys("梨子", 0) == ([], 0)
+
+# --------------------
+# 增量維護的衍生結構：一連串異動之後要跟重新建立的一樣
+# --------------------
+def _mutate(rng, steps):
+    for i in range(steps):
+        words = engine.get_words()
+        w = rng.choice(words)
+        op = rng.randrange(6)
+        if op == 0:
+            engine.add_or_update_word(f"new{i}", rng.choice(MEANING_CHARS) + rng.choice(MEANING_CHARS))
+        elif op == 1:
+            engine.update_meaning(w, rng.choice(MEANING_CHARS))
+        elif op == 2 and not engine.find_word(f"renamed{i}"):
+            engine.rename_word(w, f"renamed{i}")
+        elif op == 3:
+            engine.grade_word(w["word"], rng.random() < 0.5)
+        elif op == 4 and len(words) > 10:
+            engine.remove_word(w)
+        else:
+            rows = [{"word": f"imp{i}", "meaning": "匯入"}, {"word": w["word"], "meaning": "合併"}]
+            engine.import_words(io.StringIO("\n".join(json.dumps(r, ensure_ascii=False) for r in rows)), "jsonl", "append")
+
+def test_incremental_derived_match_rebuild(user):
+    rng = random.Random(7)
+    engine.replace_all_words(make_words(120, rng))
+    store = engine.get_shared_vocab()
+    names = ["index", "scheduler", "search", "distractors"] + (["columns"] if engine._numpy() else [])
+    for name in names:
+        store.derived(name)  # 先建好，之後的異動都走 update/remove
+
+    _mutate(rng, 300)
+
+    words = store.words
+    assert store.derived("index") == engine.build_word_index(words)
+    assert words == [w for w in store._slots if w is not None]
+    assert store._positions == {engine.word_key(w["word"]): i for i, w in enumerate(store._slots) if w is not None}
+    assert store._slot_keys == [w and engine.word_key(w["word"]) for w in store._slots]
+
+    today = datetime.date.today()
+    scheduler, fresh = store.derived("scheduler"), engine.ReviewScheduler(words)
+    for day in (today, today + datetime.timedelta(days=30)):
+        assert _keys(scheduler.due_words(day)) == _keys(fresh.due_words(day))
+        assert _keys(scheduler.permanent_words(day)) == _keys(fresh.permanent_words(day))
+
+    search, fresh = store.derived("search"), engine.WordSearchIndex(words)
+    assert search._keys == fresh._keys
+    assert search._meanings == fresh._meanings
+    assert search._grams == fresh._grams
+
+    assert _distractor_groups(store.derived("distractors")) == _distractor_groups(engine.DistractorIndex(words))
+
+    if engine._numpy():
+        columns, fresh = store.derived("columns"), engine.WordColumns(words)
+        for day in (today, today + datetime.timedelta(days=30)):
+            assert _keys(columns.due_words(day)) == _keys(fresh.due_words(day))
+            assert _keys(columns.permanent_words(day)) == _keys(fresh.permanent_words(day))
+        assert columns.level_counts() == fresh.level_counts()
+        assert len(columns) == len(words)
+
+def test_removals_leave_tombstones_until_compaction(user):
+    engine.replace_all_words(make_words(3000, random.Random(31)))
+    store = engine.get_shared_vocab()
+    before = store.words
+    for w in before[:1000:2]:
+        store.remove(engine.word_key(w["word"]))
+    assert store._dead == 500 and len(store._slots) == 3000  # 刪除只留標記，不搬動後面的單字
+    assert store.words == before[1:1000:2] + before[1000:]
+    assert len(before) == 3000  # 之前拿到的快照不受影響
+
+    for w in before[1000:2500]:
+        store.remove(engine.word_key(w["word"]))
+    assert store._dead < 1024  # 刪除標記太多時已經壓縮過
+    assert store.words == before[1:1000:2] + before[2500:]
+    assert len(store) == engine.word_count() == len(store.words)
+    assert store._positions == {engine.word_key(w["word"]): i for i, w in enumerate(store._slots) if w is not None}
+
+    renamed = dict(store.words[0], word="renamed")
+    engine.rename_word(store.words[0], "renamed")
+    engine.add_or_update_word("added", "新的")
+    assert store.words[0] == renamed
+    assert store.words[-1]["word"] == "added"
+    assert engine.find_word("renamed") == renamed
+
+def test_word_columns_compaction_after_many_removals():
+    if not engine._numpy():
+        pytest.skip("numpy 沒有安裝")
+    words = make_words(3000, random.Random(3))
+    columns = engine.WordColumns(words)
+    for w in words[:2000]:
+        columns.remove(engine.word_key(w["word"]))
+    assert columns._dead < 1024  # 刪除標記太多時已經壓縮過
+    today = datetime.date.today()
+    assert _keys(columns.due_words(today)) == _keys(engine.WordColumns(words[2000:]).due_words(today))
+
+def test_distractors_exclude_answer_and_duplicates():
+    words = make_words(200, random.Random(5))
+    index = engine.DistractorIndex(words)
+    rng = random.Random(0)
+    for w in words[:50]:
+        options = engine.choice_question(w, words, rng, index)["options"]
+        assert len(options) == len(set(options)) == engine.DISTRACTOR_COUNT + 1
+        assert options.count(w["meaning"]) == 1
@@ -0,0 +1,278 @@
+"""統計彙總、測驗結果去重與打卡連續天數：跟直接掃紀錄（原本的寫法）算出來的要一樣"""
+import datetime
+import json
+import os
+import random
+from collections import Counter
+
+import word_engine as engine
+
+WORDS = ["apple", "pear", "kiwi", "plum"]
+
+def _remove_stats_db():
+    engine._resources.clear()
+    for suffix in ("", "-wal", "-shm"):
+        path = engine.user_path(engine.STATS_DB_FILE + suffix)
+        if os.path.exists(path):
+            os.remove(path)
+
+# --------------------
+# 統計彙總
+# --------------------
+def _this_month_days():
+    today = datetime.date.today()
+    return [today.replace(day=d).isoformat() for d in range(1, today.day + 1)]
+
+def _answers(rng, n, days):
+    return [{
+        "word": rng.choice(WORDS),
+        "your_answer": "?",
+        "correct_answer": "?",
+        "is_correct": rng.random() < 0.6,
+        "answered_at": f"{rng.choice(days)} {rng.randint(0, 23):02d}:00:00",
+    } for _ in range(n)]
+
+def _expected_summary(items):
+    errors = Counter(item["word"] for item in items if not item["is_correct"])
+    per_day = {}
+    for item in items:
+        counts = per_day.setdefault(item["answered_at"][:10], [0, 0])
+        counts[0] += 1
+        counts[1] += item["is_correct"]
+    return {
+        "total": len(items),
+        "correct": sum(item["is_correct"] for item in items),
+        "wrong_counts": sorted(errors.items(), key=lambda kv: (-kv[1], kv[0]))[:engine.STATS_TOP_WRONG],
+        "recent_days": [(day, t, c) for day, (t, c) in sorted(per_day.items())][-engine.STATS_RECENT_DAYS:],
+    }
+
+def _summary():
+    summary = engine.load_stats_summary()
+    return {
+        "total": summary["total"],
+        "correct": summary["correct"],
+        "wrong_counts": [tuple(row) for row in summary["wrong_counts"]],
+        "recent_days": [tuple(row) for row in summary["recent_days"]],
+    }
+
+def test_stats_rollup_matches_answer_log(user):
+    items = _answers(random.Random(3), 200, _this_month_days())
+    for item in items:
+        engine.record_answer(item)
+        engine.get_answer_log().append(item)
+    expected = _expected_summary(items)
+    assert _summary() == expected
+
+    assert engine.rebuild_stats_rollup() == len(items)
+    assert _summary() == expected
+
+    _remove_stats_db()  # 彙總檔不見時從作答紀錄補算
+    assert _summary() == expected
+
+def _months():
+    current = engine.current_month()
+    return [engine.month_shift(current, -d) for d in (7, 5, 4, 1, 0)]
+
+def _month_answers(rng):
+    items = []
+    for month in _months():
+        for i in range(rng.randint(5, 15)):
+            items.append({
+                "word": rng.choice(["apple", "Apple", "pear", "kiwi"]),
+                "your_answer": "?",
+                "correct_answer": "?",
+                "is_correct": rng.random() < 0.6,
+                "answered_at": f"{month}-{rng.randint(1, 28):02d} 10:00:00",
+            })
+    return items
+
+def test_answer_log_compaction_keeps_totals(tmp_path):
+    items = _month_answers(random.Random(11))
+    with open(tmp_path / engine.LOG_FILE, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item) + "\n")
+    log = engine.SegmentedLog(str(tmp_path), engine.LOG_NAME, engine.summarize_answers,
+                              [str(tmp_path / engine.LOG_FILE)], engine._answer_month)
+    expected = engine.aggregate_answers(items)
+    assert engine.aggregate_answers(log, log.summaries().values()) == expected
+
+    assert log.compact(keep_months=3) == _months()[:3]
+    assert log.months() == _months()[3:]
+    assert engine.aggregate_answers(log, log.summaries().values()) == expected
+    assert log.compact(keep_months=3) == []  # 再壓縮一次不會重複計算
+    assert engine.aggregate_answers(log, log.summaries().values()) == expected
+
+def test_rebuild_stats_counts_compacted_months(user):
+    items = _month_answers(random.Random(12))
+    with open(engine.user_path(engine.LOG_FILE), "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item) + "\n")
+    assert engine.rebuild_stats_rollup() == len(items)
+    assert engine.get_answer_log().months() == _months()[3:]  # 第一次開啟時已經壓縮
+    summary = engine.load_stats_summary()
+    assert (summary["total"], summary["correct"]) == (len(items), sum(item["is_correct"] for item in items))
+
+def test_month_rollover_compacts_in_long_running_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine.persistence, "sync", True)
+    items = _month_answers(random.Random(14))
+    with open(tmp_path / engine.LOG_FILE, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item) + "\n")
+    log = engine.SegmentedLog(str(tmp_path), engine.LOG_NAME, engine.summarize_answers,
+                              [str(tmp_path / engine.LOG_FILE)], engine._answer_month)
+    log.append(items[-1])  # 同一個月追加不會壓縮
+    assert log.summaries() == {}
+
+    months = _months()
+    next_month = engine.month_shift(engine.current_month(), 1)
+    monkeypatch.setattr(engine, "current_month", lambda: next_month)
+    log.append(items[-1])
+    cutoff = engine.month_shift(next_month, -(engine.HISTORY_KEEP_MONTHS - 1))
+    assert log.months() == [month for month in [*months, next_month] if month >= cutoff]
+    assert sorted(log.summaries()) == [month for month in months if month < cutoff]
+
+def test_review_log_compaction_keeps_per_word_counts(tmp_path):
+    rng = random.Random(13)
+    log = engine.SegmentedLog(str(tmp_path), engine.REVIEW_LOG_NAME, engine.summarize_reviews)
+    items = []
+    for month in _months():
+        segment = log._segment(month)
+        for _ in range(10):
+            item = {"key": rng.choice(["apple", "pear"]), "remembered": rng.random() < 0.5,
+                    "old_level": rng.randint(1, 5), "reviewed_at": f"{month}-15 09:00:00"}
+            segment.append(item)
+            items.append(item)
+    log.compact(keep_months=3)
+
+    merged = {"total": 0, "remembered": 0, "levels": {}, "words": {}}
+    for summary in [*log.summaries().values(), engine.summarize_reviews(log)]:
+        merged["total"] += summary["total"]
+        merged["remembered"] += summary["remembered"]
+        for part in ("levels", "words"):
+            for name, (n, ok) in summary[part].items():
+                counts = merged[part].setdefault(name, [0, 0])
+                counts[0] += n
+                counts[1] += ok
+    assert merged == engine.summarize_reviews(items)
+
+# --------------------
+# 測驗結果去重
+# --------------------
+def _quiz_row(quiz_words, wrong_words, when=None):
+    total = len(quiz_words)
+    accuracy = f"{round((total - len(wrong_words)) / total * 100, 2)}%"
+    return {
+        "測驗時間": when or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "題數": total,
+        "正確率": accuracy,
+        "錯誤單字": ", ".join(wrong_words) if wrong_words else "無",
+        "單字列表": quiz_words,
+        "指紋": engine.quiz_fingerprint(total, accuracy, wrong_words, quiz_words),
+    }
+
+def test_quiz_results_dedup_by_fingerprint(user):
+    row = _quiz_row(["apple", "pear", "kiwi"], ["pear"])
+    assert engine.save_quiz_result(row)
+    assert not engine.save_quiz_result(_quiz_row(["kiwi", "apple", "pear"], ["pear"]))  # 順序不同也算同一次
+    assert engine.save_quiz_result(_quiz_row(["apple", "pear", "kiwi"], []))
+    assert [r["錯誤單字"] for r in engine.load_quiz_results()] == ["pear", "無"]
+
+    engine.clear_quiz_results()
+    assert engine.load_quiz_results() == []
+    assert engine.save_quiz_result(row)  # 清空後指紋也一起清掉
+
+def test_quiz_fingerprints_backfilled_from_legacy_rows(user):
+    legacy = _quiz_row(["apple", "pear"], ["apple"])
+    del legacy["指紋"]  # 升級前的紀錄沒有存指紋
+    with open(engine.user_path(engine.QUIZ_RESULT_FILE), "w", encoding="utf-8") as f:
+        json.dump([legacy], f, ensure_ascii=False)
+
+    assert not engine.save_quiz_result(_quiz_row(["pear", "apple"], ["apple"]))
+    assert engine.save_quiz_result(_quiz_row(["apple", "pear"], []))
+    assert len(engine.load_quiz_results()) == 2
+
+# --------------------
+# 打卡連續天數：跟原本 0524.py 逐日掃描的寫法對照
+# --------------------
+def baseline_streak(records, user):
+    unique_dates = sorted({c["datetime"][:10] for c in records if c.get("user") == user})
+    max_streak = 0
+    streak = 0
+    last_date = None
+    for d in unique_dates:
+        d_obj = datetime.datetime.strptime(d, "%Y-%m-%d")
+        if last_date is None or (d_obj - last_date).days == 1:
+            streak += 1
+        else:
+            streak = 1
+        max_streak = max(max_streak, streak)
+        last_date = d_obj
+    return len(unique_dates), max_streak
+
+def _checkins(rng, users=("amy", "ben"), span=90):
+    start = datetime.date.today() - datetime.timedelta(days=span - 1)
+    records = []
+    for user in users:
+        for offset in rng.sample(range(span), rng.randint(1, span)):
+            day = (start + datetime.timedelta(days=offset)).isoformat()
+            for _ in range(rng.randint(1, 2)):  # 同一天打卡兩次只算一天
+                records.append({"user": user, "datetime": f"{day} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"})
+    return records
+
+def test_checkin_streaks_match_baseline():
+    for seed in range(20):
+        records = _checkins(random.Random(seed))
+        random.Random(seed).shuffle(records)  # 紀錄順序不影響結果
+        states = engine.checkin_streaks(records)
+        for user in ("amy", "ben"):
+            days, _, max_streak, last_day = states[user]
+            assert (days, max_streak) == baseline_streak(records, user)
+            assert last_day == max(c["datetime"][:10] for c in records if c["user"] == user)
+
+def test_current_streak_breaks_after_a_missed_day():
+    today = datetime.date(2026, 3, 10)
+    state = (0, 0, 0, None)
+    for day in ("2026-03-07", "2026-03-08", "2026-03-09"):
+        state = engine._advance_streak(state, day)
+    assert state == (3, 3, 3, "2026-03-09")
+    assert engine._advance_streak(state, "2026-03-09") == state
+    assert engine.current_streak(state, today) == 3
+    assert engine.current_streak(state, today + datetime.timedelta(days=1)) == 0
+    assert engine._advance_streak(state, "2026-03-11") == (4, 1, 3, "2026-03-11")
+
+def test_record_checkin_keeps_running_state(user):
+    records = sorted(_checkins(random.Random(5)), key=lambda c: c["datetime"])
+    for record in records:
+        engine.record_checkin(record)
+    expected = {u: engine.checkin_streaks(records)[u] for u in ("amy", "ben")}
+    for u in ("amy", "ben"):
+        state = engine.load_checkin_state(u)
+        assert (state["days"], state["max_streak"]) == baseline_streak(records, u)
+        assert state["last_day"] == expected[u][3]
+        assert state["streak"] == engine.current_streak(expected[u])
+
+    _remove_stats_db()  # 狀態表不見時從打卡紀錄重建
+    for u in ("amy", "ben"):
+        state = engine.load_checkin_state(u)
+        assert (state["days"], state["max_streak"]) == baseline_streak(records, u)
+
+# --------------------
+# 每天學的單字
+# --------------------
+def test_legacy_today_word_files_import_into_table(user):
+    for day, words in [("2026-01-02", ["apple", "pear"]), ("2026-01-05", ["kiwi"]), ("2026-02-01", ["plum"])]:
+        with open(engine.user_path(f"today_words_{day}.json"), "w", encoding="utf-8") as f:
+            json.dump(words, f)
+    assert engine.load_words_between("2026-01-01", "2026-01-31") == {"2026-01-02": ["apple", "pear"], "2026-01-05": ["kiwi"]}
+    assert engine.load_today_words("2026-02-01") == ["plum"]
+    assert not [name for name in os.listdir(engine.user_dir()) if name.startswith("today_words_")]
+    assert sorted(os.listdir(engine.user_path(engine.LEGACY_TODAY_WORDS_DIR))) == [
+        "today_words_2026-01-02.json", "today_words_2026-01-05.json", "today_words_2026-02-01.json"]
+
+def test_save_today_words_replaces_that_day(user):
+    engine.save_today_words(["apple", "pear"], "2026-01-02")
+    engine.save_today_words(["kiwi"])
+    engine.save_today_words(["pear", "apple", "plum"], "2026-01-02")
+    assert engine.load_today_words("2026-01-02") == ["pear", "apple", "plum"]
+    assert engine.load_today_words() == ["kiwi"]
+    assert engine.load_words_between("2026-01-03", "2026-01-31") == {}
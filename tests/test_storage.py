@@ -0,0 +1,242 @@
+"""儲存層：舊格式轉換、跨 process 的快照更新、使用者分區與複習 journal"""
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import closing
+
+import word_engine as engine
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+def _words(words):
+    return sorted(w["word"] for w in words)
+
+# --------------------
+# 舊格式轉換
+# --------------------
+def test_legacy_answer_log_migrates_to_jsonl(user):
+    today = datetime.date.today().isoformat()
+    items = [
+        {"word": word, "your_answer": "?", "correct_answer": "?", "is_correct": ok, "answered_at": f"{today} 10:00:0{i}"}
+        for i, (word, ok) in enumerate([("apple", True), ("pear", False), ("apple", False)])
+    ]
+    _write_json(engine.user_path(engine.LEGACY_LOG_FILE), items)
+    log = engine.get_answer_log()
+    assert list(log) == items
+    assert not os.path.exists(engine.user_path(engine.LEGACY_LOG_FILE))
+    assert os.path.exists(engine.user_path(engine.LEGACY_LOG_FILE + ".migrated"))
+
+    item = dict(items[0], answered_at=f"{today} 11:00:00")
+    log.append(item)
+    assert list(log) == items + [item]
+
+def test_legacy_words_json_imports_into_sqlite(user):
+    words = [
+        {"word": "apple", "meaning": "蘋果", "level": 3, "last_review": "2026-01-02"},
+        {"word": "Pear", "meaning": "梨", "level": 1, "last_review": None},
+    ]
+    with engine.acting_user("upgraded"):  # 還沒有 words.db 的使用者
+        _write_json(engine.user_path(engine.WORDS_FILE), words)
+        assert engine._read_words() == words
+        assert os.path.exists(engine.user_path(engine.WORDS_FILE + ".migrated"))
+        assert engine._read_words() == words  # 第二次直接讀資料庫，不會重複匯入
+        assert engine.get_shared_vocab().current_words() == words
+
+# --------------------
+# 跨 process 共用的快照
+# --------------------
+def test_snapshot_reloads_only_after_another_process_writes(user):
+    engine.add_or_update_word("apple", "蘋果")
+    store = engine.get_shared_vocab()
+    snapshot = store.current_words()
+    assert store.current_words() is snapshot  # 檔案沒變就不重新讀取
+
+    with closing(engine.open_words_db()) as conn, conn:  # 模擬別的 process 直接寫資料庫
+        conn.execute(engine.WORD_UPSERT_SQL, engine._word_row({"word": "kiwi", "meaning": "奇異果"}))
+    assert _words(store.current_words()) == ["apple", "kiwi"]
+    assert _words(snapshot) == ["apple"]  # 舊快照維持原樣，正在讀它的 session 不受影響
+    assert engine.find_word("kiwi")["meaning"] == "奇異果"
+
+# --------------------
+# 使用者分區
+# --------------------
+def test_users_have_separate_vocabularies(user):
+    engine.add_or_update_word("apple", "蘋果")
+    with engine.acting_user("other"):
+        assert engine.get_shared_vocab().current_words() == []
+        engine.add_or_update_word("kiwi", "奇異果")
+        assert _words(engine._read_words()) == ["kiwi"]
+    assert _words(engine.get_shared_vocab().current_words()) == ["apple"]
+    assert _words(engine._read_words()) == ["apple"]
+
+def test_adopt_legacy_data_moves_root_files_to_owner(user, tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    root.mkdir()
+    monkeypatch.chdir(root)
+    words = [{"word": "apple", "meaning": "蘋果", "level": 2, "last_review": "2026-01-02"}]
+    _write_json(root / engine.WORDS_FILE, words)
+
+    assert not engine.adopt_legacy_data("someone")
+    assert (root / engine.WORDS_FILE).exists()
+    assert engine.adopt_legacy_data(engine.LEGACY_DATA_OWNER)
+    assert not (root / engine.WORDS_FILE).exists()
+    with engine.acting_user(engine.LEGACY_DATA_OWNER):
+        assert engine._read_words() == words
+
+def test_adopt_legacy_data_splits_shared_checkins(user, tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    root.mkdir()
+    monkeypatch.chdir(root)
+    records = [
+        {"user": "bob", "datetime": "2026-01-01 09:00:00"},
+        {"user": engine.LEGACY_DATA_OWNER, "datetime": "2026-01-01 10:00:00"},
+        {"user": "bob", "datetime": "2026-01-02 09:00:00"},
+        {"datetime": "2026-01-03 09:00:00"},  # 沒記使用者的歸給舊資料的主人
+    ]
+    _write_json(root / engine.LEGACY_CHECKIN_FILE, records)
+    with engine.acting_user("bob"):
+        engine.record_checkin({"user": "bob", "datetime": "2026-01-03 08:00:00"})  # 分區後已經打過卡
+
+    assert engine.adopt_legacy_data(engine.LEGACY_DATA_OWNER)
+    assert not (root / engine.LEGACY_CHECKIN_FILE).exists()
+    with engine.acting_user("bob"):
+        assert sorted(c["datetime"] for c in engine.get_checkin_log()) == [
+            "2026-01-01 09:00:00", "2026-01-02 09:00:00", "2026-01-03 08:00:00"]
+        assert engine.load_checkin_state("bob")["max_streak"] == 3
+    with engine.acting_user(engine.LEGACY_DATA_OWNER):
+        assert [c["datetime"] for c in engine.get_checkin_log()] == ["2026-01-01 10:00:00", "2026-01-03 09:00:00"]
+        assert os.path.exists(engine.user_path(engine.LEGACY_CHECKIN_FILE + ".migrated"))
+
+# --------------------
+# 背景寫入
+# --------------------
+def test_periodic_jobs_run_on_the_worker_thread():
+    worker = engine.PersistenceWorker(sync=False, tick_seconds=0.05)
+    ran = threading.Event()
+    worker.add_periodic(ran.set)
+    worker.ensure_running()  # 還沒送出任何寫入也要跑
+    try:
+        assert ran.wait(5)
+    finally:
+        worker.stop()
+
+def _resources_lock_free():
+    free = []
+    def probe():
+        if engine._resources_lock.acquire(blocking=False):
+            engine._resources_lock.release()
+            free.append(True)
+    thread = threading.Thread(target=probe)
+    thread.start()
+    thread.join(5)
+    return bool(free)
+
+def test_on_create_waits_for_outermost_resource(user):
+    # factory 裡又取用別的資源（例如開統計檔時取作答紀錄）：裡層的 on_create 也要等外層放開全域鎖才跑
+    events = []
+    def outer(directory):
+        engine.user_resource("inner", lambda d: "inner", lambda obj: events.append((obj, _resources_lock_free())))
+        events.append("outer built")
+        return "outer"
+    assert engine.user_resource("outer", outer, lambda obj: events.append((obj, _resources_lock_free()))) == "outer"
+    assert events == ["outer built", ("inner", True), ("outer", True)]
+    assert engine.user_resource("outer", outer, events.append) == "outer"  # 已經建過就不再呼叫
+    assert len(events) == 3
+
+def test_flush_waits_only_for_earlier_writes():
+    worker = engine.PersistenceWorker(maxsize=4, sync=False)
+    started, first, later = threading.Event(), threading.Event(), threading.Event()
+    try:
+        worker.submit(lambda: (started.set(), first.wait()))
+        started.wait(5)
+        flusher = threading.Thread(target=worker.flush)
+        flusher.start()
+        deadline = time.monotonic() + 5
+        while worker.depth() < 1 and time.monotonic() < deadline:  # 等 flush 的標記排進佇列
+            time.sleep(0.01)
+        worker.submit(later.wait)  # flush 之後才送出的寫入
+
+        flusher.join(0.2)
+        assert flusher.is_alive()  # 前面的寫入還沒做完
+        first.set()
+        flusher.join(5)
+        assert not flusher.is_alive()  # 不必等後來送出、還卡著的那一筆
+    finally:
+        first.set()
+        later.set()
+        worker.stop()
+
+# --------------------
+# 複習 journal
+# --------------------
+def test_replay_applies_leftover_journal(user):
+    engine.add_or_update_word("apple", "蘋果")
+    engine.add_or_update_word("pear", "梨")
+    path = engine.review_journal_path("crashed")
+    journal = engine.JsonlLog(path)
+    for remembered in (True, True):  # 同一個單字評了兩次，以最後一次為準
+        w, old_level = engine.grade_word("apple", remembered)
+        journal.append(engine.review_event(w, remembered, old_level))
+    engine._resources.clear()  # 模擬當機：評分只留在 journal 裡
+
+    engine.replay_review_journals()
+    assert not os.path.exists(path)
+    assert {w["word"]: w["level"] for w in engine._read_words()} == {"apple": 3, "pear": 1}
+    assert [e["old_level"] for e in engine.get_review_log()] == [1, 2]
+
+def test_json_backend_keeps_other_writers_changes(user, monkeypatch):
+    monkeypatch.setattr(engine, "WORDS_BACKEND", "json")
+    engine.add_or_update_word("apple", "蘋果")
+    # 別的 process 在這之後寫進一個單字，本 process 的快照裡沒有它
+    path = engine.user_path(engine.WORDS_FILE)
+    stored = engine.read_json(path, [])
+    engine.atomic_write_json(path, stored + [{"word": "kiwi", "meaning": "奇異果", "level": 1, "last_review": None}])
+    engine.add_or_update_word("pear", "梨")
+    engine.remove_word(engine.find_word("apple"))
+    assert _words(engine.read_json(path, [])) == ["kiwi", "pear"]
+
+def test_replay_skips_live_journal(user):
+    engine.add_or_update_word("apple", "蘋果")
+    w, old_level = engine.grade_word("apple", True)
+    path = engine.open_review_journal("live")
+    engine.JsonlLog(path).append(engine.review_event(w, True, old_level))
+
+    engine.replay_review_journals()  # 還有 session 持有這個 journal，不能動
+    assert os.path.exists(path)
+    assert list(engine.get_review_log()) == []
+
+    engine._release_live_journals(engine.user_dir())  # 模擬持有的 process 結束
+    engine.replay_review_journals()
+    assert not os.path.exists(path)
+    assert [e["key"] for e in engine.get_review_log()] == ["apple"]
+    assert engine._read_words()[0]["level"] == 2
+
+def test_stale_review_buffers_flushed_from_any_session(user):
+    engine.add_or_update_word("apple", "蘋果")
+    engine.add_or_update_word("pear", "梨")
+    for session_id, word in [("idle", "apple"), ("active", "pear")]:
+        w, old_level = engine.grade_word(word, True)
+        assert engine.buffer_review_change(session_id, engine.review_event(w, True, old_level)) == 1
+    journals = [b.path for b in engine._review_buffers.values()]
+    assert all(os.path.exists(path) for path in journals)
+
+    engine.flush_stale_review_buffers(max_age=3600)  # 還沒放太久，不寫回
+    assert {w["word"]: w["level"] for w in engine._read_words()} == {"apple": 1, "pear": 1}
+
+    engine.flush_stale_review_buffers(max_age=0)  # 閒置分頁的暫存也一起寫回
+    assert {w["word"]: w["level"] for w in engine._read_words()} == {"apple": 2, "pear": 2}
+    assert sorted(e["key"] for e in engine.get_review_log()) == ["apple", "pear"]
+    assert not any(os.path.exists(path) for path in journals)
+    assert engine.flush_review_buffer("idle")  # 已經被寫回，不會再寫一次
+    assert len(list(engine.get_review_log())) == 2
+
+    w, old_level = engine.grade_word("apple", True)  # 同一個 session 之後的評分開新的一批
+    engine.buffer_review_change("idle", engine.review_event(w, True, old_level))
+    assert engine._review_buffers[(engine.user_dir(), "idle")].path not in journals
+    engine.flush_review_buffer("idle")
+    assert engine._read_words()[0]["level"] == 3
+    assert engine._review_buffers == {}
@@ -0,0 +1,2391 @@
+"""背單字系統的核心邏輯：資料儲存、出題、複習排程、打卡與統計。
+
+不依賴 Streamlit，CLI 與批次工作可以直接 import；pandas 只在真的要產生表格時才載入。
+介面（0524.py）只負責畫面與 session 狀態。
+"""
+import bisect
+import random
+import atexit
+import csv
+import datetime
+import glob
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import closing, contextmanager, nullcontext
+from collections import Counter
+
+try:
+    import fcntl  # 檔案鎖只在 POSIX 系統有，Windows 上退回不加鎖
+except ImportError:
+    fcntl = None
+
+# --------------------
+# 效能量測（計時與 I/O 計數）；關閉時每個量測點只多一次屬性檢查
+# --------------------
+METRICS_ENABLED = os.environ.get("LKK_METRICS", "0") == "1"
+METRICS_FILE = os.environ.get("LKK_METRICS_FILE")  # 有設定才定期匯出成 JSON
+METRICS_EXPORT_SECONDS = 60
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """整個 process 共用的計數器與計時器（所有使用者合計）"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._exported_at = 0.0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}  # 名稱 → [次數, 總秒數, 最長秒數]
+            self.since = time.time()
+
+    def incr(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stat = self.timers.get(name)
+            if stat is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                stat[0] += 1
+                stat[1] += seconds
+                stat[2] = max(stat[2], seconds)
+
+    def timer(self, name):
+        """with metrics.timer("名稱"): ...；關閉時回傳什麼都不做的 context"""
+        if not self.enabled:
+            return nullcontext()
+        return _Timer(self, name)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "since": datetime.datetime.fromtimestamp(self.since).isoformat(timespec="seconds"),
+                "counters": dict(self.counters),
+                "timers": {name: {"count": c, "total_ms": t * 1000, "max_ms": m * 1000}
+                           for name, (c, t, m) in self.timers.items()},
+            }
+
+    def export(self, path=None):
+        path = path or METRICS_FILE
+        if not path:
+            return None
+        data = self.snapshot()
+        data["exported_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+        atomic_write_json(path, data)
+        self._exported_at = time.time()
+        return path
+
+    def export_if_due(self):
+        # 只有開啟量測且設定了匯出檔時才寫，最多每 METRICS_EXPORT_SECONDS 秒一次
+        if self.enabled and METRICS_FILE and time.time() - self._exported_at >= METRICS_EXPORT_SECONDS:
+            self.export()
+
+metrics = Metrics(METRICS_ENABLED)
+
+def _count_file_read(f):
+    if metrics.enabled:
+        metrics.incr("file_opens")
+        metrics.incr("bytes_read", os.fstat(f.fileno()).st_size)
+
+# --------------------
+# 使用者資料分區（每位使用者一個資料夾）、檔案鎖與原子寫入
+# --------------------
+DATA_DIR = os.environ.get("LKK_DATA_DIR", "data")
+LEGACY_DATA_OWNER = os.environ.get("LKK_LEGACY_DATA_OWNER", "admin")  # 分區前放在根目錄的舊資料歸給誰
+LEGACY_DATA_PATTERNS = [
+    "words.json", "words.json.migrated", "words.db", "words.db-wal", "words.db-shm",
+    "log.json", "log.json.migrated", "log.jsonl", "stats.db", "stats.db-wal", "stats.db-shm",
+    "quiz_result.json", "checkin.json.migrated", "checkin.jsonl.migrated",
+    "today_words_*.json", "review_pending_*.jsonl",
+]
+_acting = threading.local()
+_resources = {}  # (種類, 使用者資料夾) → 整個 process 共用的物件
+_resources_lock = threading.RLock()
+_resource_calls = threading.local()  # 這個執行緒 user_resource 的巢狀層數與延後的 on_create
+
+@contextmanager
+def acting_user(user):
+    """在這個 with 區塊內，所有讀寫都落在該使用者的資料夾"""
+    previous = getattr(_acting, "user", None)
+    _acting.user = user
+    try:
+        yield
+    finally:
+        _acting.user = previous
+
+def user_dir(user=None):
+    user = user or getattr(_acting, "user", None)
+    if not user:
+        raise RuntimeError("尚未指定使用者，請在 acting_user() 區塊內讀寫資料")
+    path = os.path.join(DATA_DIR, user)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def user_path(name):
+    return os.path.join(user_dir(), name)
+
+def user_resource(kind, factory, on_create=None):
+    """每位使用者在整個 process 只建一次的物件（例如共用快照、紀錄檔），factory 收到使用者資料夾。
+    on_create 在建好之後、最外層的 user_resource 放開全域鎖才呼叫，裡面可以排背景工作
+    （factory 裡又取用別的資源時也一樣延後，佇列滿時等待不會卡住其他使用者的取用）"""
+    directory = user_dir()
+    depth = getattr(_resource_calls, "depth", 0)
+    if depth == 0:
+        _resource_calls.pending = []
+    _resource_calls.depth = depth + 1
+    try:
+        with _resources_lock:
+            obj = _resources.get((kind, directory))
+            if obj is None:
+                obj = _resources[(kind, directory)] = factory(directory)
+                if on_create is not None:
+                    outside_resource_lock(lambda: on_create(obj))
+    finally:
+        _resource_calls.depth = depth
+        if depth == 0:
+            pending, _resource_calls.pending = _resource_calls.pending, []
+            for callback in pending:
+                callback()
+    return obj
+
+def outside_resource_lock(callback):
+    """callback 要排背景工作時用：不在 user_resource 的 factory 裡就當場呼叫，否則等最外層放開全域鎖再呼叫"""
+    if getattr(_resource_calls, "depth", 0):
+        _resource_calls.pending.append(callback)
+    else:
+        callback()
+
+@contextmanager
+def file_lock(path):
+    """對 path 加 advisory lock（另開 .lock 檔），同一時間只有一個寫入者做讀-改-寫"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def atomic_write_json(path, data):
+    # 先寫到同資料夾的暫存檔再 rename，讀的人只會看到舊檔或完整的新檔
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with metrics.timer("json_write"):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+            if metrics.enabled:
+                metrics.incr("file_opens")
+                metrics.incr("bytes_written", os.fstat(f.fileno()).st_size)
+        os.replace(tmp_path, path)
+
+def read_json(path, default=None):
+    """讀取整份 JSON 檔，檔案不存在回傳 default"""
+    if not os.path.exists(path):
+        return default
+    with metrics.timer("json_load"):
+        with open(path, "r", encoding="utf-8") as f:
+            _count_file_read(f)
+            return json.load(f)
+
+def adopt_legacy_data(user):
+    """把分區前放在根目錄的舊資料搬進 LEGACY_DATA_OWNER 的資料夾（每個 process 檢查一次）"""
+    if user != LEGACY_DATA_OWNER:
+        return False
+    with acting_user(user):
+        return user_resource("legacy_adopted", _adopt_legacy_files)
+
+def _adopt_legacy_files(target):
+    users = _split_legacy_checkins()
+    for pattern in LEGACY_DATA_PATTERNS:
+        for path in glob.glob(pattern):
+            dest = os.path.join(target, os.path.basename(path))
+            if not os.path.exists(dest):
+                os.replace(path, dest)
+    # 已經有統計檔的人（包括剛搬進來、存著所有人狀態的那份）照自己的打卡紀錄重算連續天數
+    for user in users | {LEGACY_DATA_OWNER}:
+        if os.path.exists(os.path.join(user_dir(user), STATS_DB_FILE)):
+            with acting_user(user), closing(open_stats_db()) as conn:
+                _rebuild_checkin_state(conn)
+    return True
+
+def _split_legacy_checkins():
+    """分區前所有人共用一份打卡紀錄：依每筆的 user 追加到各自資料夾（沒有 user 的歸 LEGACY_DATA_OWNER），
+    舊檔改名為 .migrated 再跟其他舊資料一起搬走，回傳分到紀錄的使用者"""
+    by_user = {}
+    sources = [path for path in (LEGACY_CHECKIN_FILE, CHECKIN_FILE) if os.path.exists(path)]
+    for path in sources:
+        items = read_json(path, []) if path.endswith(".json") else JsonlLog(path)
+        for item in items:
+            by_user.setdefault(item.get("user") or LEGACY_DATA_OWNER, []).append(item)
+    for user, items in by_user.items():
+        path = os.path.join(user_dir(user), CHECKIN_FILE)
+        with file_lock(path), open(path, "a", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    for path in sources:
+        os.replace(path, path + ".migrated")
+    return set(by_user)
+
+# --------------------
+# 背景寫入：按鈕處理只把寫檔工作放進佇列，由單一執行緒依序寫入
+# --------------------
+PERSIST_QUEUE_SIZE = int(os.environ.get("LKK_PERSIST_QUEUE_SIZE", "256"))
+PERSIST_SYNC = os.environ.get("LKK_PERSIST_SYNC", "0") == "1"  # 設成 1 就在呼叫端直接寫（除錯用）
+PERSIST_TICK_SECONDS = float(os.environ.get("LKK_PERSIST_TICK_SECONDS", "10"))  # 定期工作（例如寫回閒置分頁的評分）多久跑一次
+
+class PersistenceWorker:
+    """單一背景執行緒、有上限的 FIFO 佇列，所以同一個檔案的寫入一定照送出的順序。
+    佇列滿了時送出的一方會等到有空位（不丟資料、不插隊），submit 回傳 False 讓介面提示"""
+
+    def __init__(self, maxsize=PERSIST_QUEUE_SIZE, sync=PERSIST_SYNC, tick_seconds=PERSIST_TICK_SECONDS):
+        self.sync = sync
+        self.tick_seconds = tick_seconds
+        self._periodic = []
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.max_depth = 0
+        self.waits = 0  # 佇列滿了、送出的一方必須等待的次數
+        self.errors = 0
+        self.last_error = None
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name="lkk-persistence", daemon=True)
+                    self._thread.start()
+
+    def ensure_running(self):
+        # 只排了定期工作、還沒送出過寫入時，背景執行緒也要先跑起來
+        if not self.sync:
+            self._ensure_started()
+
+    def add_periodic(self, job):
+        """每 tick_seconds 秒在背景執行緒跑一次 job（佇列忙碌時排在寫入之間，不會一直延後）"""
+        self._periodic.append(job)
+
+    def submit(self, job):
+        """把 job 排進佇列，之後在送出時的使用者資料夾內執行；回傳是否不必等待就排進去"""
+        item = (getattr(_acting, "user", None), job)
+        if self.sync or threading.current_thread() is self._thread:
+            # 寫入工作裡再送出的工作（例如第一次取用紀錄檔時排的壓縮）直接做，不然佇列滿時會自己等自己
+            self._run(item)
+            return True
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+            queued = True
+        except queue.Full:
+            self.waits += 1
+            metrics.incr("persist_waits")
+            self._queue.put(item)
+            queued = False
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return queued
+
+    def _loop(self):
+        next_tick = time.monotonic() + self.tick_seconds
+        while True:
+            try:
+                item = self._queue.get(timeout=max(next_tick - time.monotonic(), 0))
+            except queue.Empty:
+                pass
+            else:
+                try:
+                    if item is None:
+                        return
+                    self._run(item)
+                finally:
+                    self._queue.task_done()
+            if time.monotonic() >= next_tick:
+                for job in list(self._periodic):
+                    self._run((None, job))
+                next_tick = time.monotonic() + self.tick_seconds
+
+    def _run(self, item):
+        user, job = item
+        try:
+            with metrics.timer("persist_job"):
+                if user:
+                    with acting_user(user):
+                        job()
+                else:
+                    job()
+        except Exception as e:
+            # 一筆寫入失敗不能讓執行緒停掉，記下來在系統監控頁顯示
+            self.errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """等呼叫之前送出的寫入都完成（要讀剛寫入的資料前呼叫）。佇列是 FIFO，
+        排一個標記進去、等它被執行到就好，不必等到整個佇列清空（之後別人送出的寫入不用等）"""
+        if self.sync or threading.current_thread() is self._thread:
+            return  # 寫入工作裡呼叫時，排在前面的都已經做完
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put((None, done.set))
+        done.wait()
+
+    def stop(self):
+        # 程式結束前把還在佇列裡的寫完
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def status(self):
+        return {
+            "depth": self.depth(),
+            "capacity": self._queue.maxsize,
+            "max_depth": self.max_depth,
+            "waits": self.waits,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+persistence = PersistenceWorker()
+
+def flush_persistence():
+    persistence.flush()
+
+# --------------------
+# 單字永久儲存功能
+# --------------------
+WORDS_FILE = "words.json"
+WORDS_DB_FILE = "words.db"
+WORDS_BACKEND = os.environ.get("WORDS_BACKEND", "sqlite")  # "sqlite" 或 "json"
+
+WORDS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS words (
+    id INTEGER PRIMARY KEY,
+    word TEXT NOT NULL,
+    word_key TEXT NOT NULL,
+    meaning TEXT NOT NULL DEFAULT '',
+    level INTEGER NOT NULL DEFAULT 1,
+    last_review TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_words_key ON words(word_key);
+CREATE INDEX IF NOT EXISTS idx_words_level ON words(level);
+CREATE INDEX IF NOT EXISTS idx_words_last_review ON words(last_review);
+"""
+
+WORD_UPSERT_SQL = """
+INSERT INTO words (word, word_key, meaning, level, last_review)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(word_key) DO UPDATE SET
+    word = excluded.word,
+    meaning = excluded.meaning,
+    level = excluded.level,
+    last_review = excluded.last_review
+"""
+
+def word_key(word):
+    # 單字比對一律用去空白、小寫後的字串
+    return word.strip().lower()
+
+def _word_row(w):
+    return (w["word"], word_key(w["word"]), w.get("meaning", ""), w.get("level", 1), w.get("last_review"))
+
+def open_words_db():
+    db_path = user_path(WORDS_DB_FILE)
+    json_path = user_path(WORDS_FILE)
+    first_time = not os.path.exists(db_path)
+    metrics.incr("sqlite_opens")
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")  # 多個 session 同時讀寫時不會互相卡住
+    conn.executescript(WORDS_SCHEMA)
+    if first_time and os.path.exists(json_path):
+        # 第一次使用 SQLite 時匯入舊的 words.json，舊檔改名保留
+        legacy = read_json(json_path, [])
+        with conn:
+            conn.executemany(WORD_UPSERT_SQL, [_word_row(w) for w in legacy])
+        os.replace(json_path, json_path + ".migrated")
+    return conn
+
+def _read_words():
+    if WORDS_BACKEND == "sqlite":
+        with metrics.timer("sqlite_words_load"), closing(open_words_db()) as conn:
+            rows = conn.execute("SELECT word, meaning, level, last_review FROM words ORDER BY id").fetchall()
+        return [{"word": r[0], "meaning": r[1], "level": r[2], "last_review": r[3]} for r in rows]
+    return read_json(user_path(WORDS_FILE), [])
+
+def get_words_cache():
+    # 整個 process 共用（每位使用者一份）：儲存檔最後一次的簽章（mtime、大小）與版本號；單字本身放在 SharedVocab
+    return user_resource("words_cache", lambda directory: {"lock": threading.Lock(), "signature": None, "version": 0})
+
+def words_signature():
+    if WORDS_BACKEND == "sqlite":
+        paths = [user_path(WORDS_DB_FILE), user_path(WORDS_DB_FILE + "-wal")]
+    else:
+        paths = [user_path(WORDS_FILE)]
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def words_version():
+    """目前單字庫的版本號；檔案被別的 process 改過（簽章不同）時版本號加一"""
+    cache = get_words_cache()
+    signature = words_signature()
+    with cache["lock"]:
+        if signature != cache["signature"]:
+            cache["signature"] = signature
+            cache["version"] += 1
+        return cache["version"]
+
+def _words_written():
+    # 自己寫入後直接記下新的簽章，避免被當成外部修改
+    cache = get_words_cache()
+    with cache["lock"]:
+        cache["signature"] = words_signature()
+        cache["version"] += 1
+
+def save_words(words):
+    # 整份覆寫，只用在清空等批次動作；單筆異動請用 save_word / delete_word
+    if WORDS_BACKEND == "sqlite":
+        with metrics.timer("sqlite_words_save"), closing(open_words_db()) as conn, conn:
+            conn.execute("DELETE FROM words")
+            conn.executemany(WORD_UPSERT_SQL, [_word_row(w) for w in words])
+    else:
+        json_path = user_path(WORDS_FILE)
+        with file_lock(json_path):
+            atomic_write_json(json_path, words)
+    _words_written()
+
+def _update_json_words(change):
+    """JSON 後端的單筆或批次異動：鎖住後重新讀檔，交給 change 改完（回傳新的 list）再寫回，
+    不會蓋掉別的 process 剛寫進去的內容"""
+    json_path = user_path(WORDS_FILE)
+    with file_lock(json_path):
+        atomic_write_json(json_path, change(_read_words()))
+    _words_written()
+
+def _upsert_json_words(words, items):
+    # items 是 (單字, 舊 key 或 None)；找得到（改名時找舊 key）就原地換掉，找不到就加在最後
+    positions = {word_key(w["word"]): i for i, w in enumerate(words)}
+    for w, old_key in items:
+        key = word_key(w["word"])
+        pos = positions.pop(old_key if old_key is not None else key, None)
+        if pos is None:
+            pos = len(words)
+            words.append(w)
+        else:
+            words[pos] = w
+        positions[key] = pos
+    return words
+
+def save_word(w, old_key=None):
+    """新增或更新單一單字；SQLite 只 UPSERT 這一列，JSON 則重新讀檔後只改這個單字。改名時傳入舊的 key"""
+    if WORDS_BACKEND != "sqlite":
+        _update_json_words(lambda stored: _upsert_json_words(stored, [(w, old_key)]))
+        return
+    with metrics.timer("sqlite_words_save"), closing(open_words_db()) as conn, conn:
+        if old_key is not None and old_key != word_key(w["word"]):
+            conn.execute(
+                "UPDATE words SET word = ?, word_key = ?, meaning = ?, level = ?, last_review = ? WHERE word_key = ?",
+                _word_row(w) + (old_key,)
+            )
+        else:
+            conn.execute(WORD_UPSERT_SQL, _word_row(w))
+    _words_written()
+
+def save_review_updates(updates):
+    """批次寫回複習結果（key、level、last_review），整批只開一次交易或寫一次檔"""
+    if not updates:
+        return
+    if WORDS_BACKEND == "sqlite":
+        with metrics.timer("sqlite_words_save"), closing(open_words_db()) as conn, conn:
+            conn.executemany(
+                "UPDATE words SET level = ?, last_review = ? WHERE word_key = ?",
+                [(u["level"], u["last_review"], u["key"]) for u in updates]
+            )
+        _words_written()
+        return
+
+    def change(words):
+        by_key = {word_key(w["word"]): w for w in words}
+        for u in updates:
+            w = by_key.get(u["key"])
+            if w is not None:
+                w["level"] = u["level"]
+                w["last_review"] = u["last_review"]
+        return words
+    _update_json_words(change)
+
+def save_many_words(changed):
+    """批次新增或更新（例如匯入）；SQLite 整批一次交易 UPSERT，JSON 則重新讀檔後整批改完寫入一次"""
+    if WORDS_BACKEND != "sqlite":
+        _update_json_words(lambda stored: _upsert_json_words(stored, [(w, None) for w in changed]))
+        return
+    with metrics.timer("sqlite_words_save"), closing(open_words_db()) as conn, conn:
+        conn.executemany(WORD_UPSERT_SQL, [_word_row(w) for w in changed])
+    _words_written()
+
+def delete_word(w):
+    if WORDS_BACKEND != "sqlite":
+        key = word_key(w["word"])
+        _update_json_words(lambda stored: [s for s in stored if word_key(s["word"]) != key])
+        return
+    with metrics.timer("sqlite_words_save"), closing(open_words_db()) as conn, conn:
+        conn.execute("DELETE FROM words WHERE word_key = ?", (word_key(w["word"]),))
+    _words_written()
+
+# --------------------
+# 每天學的單字（stats.db 的 daily_words 表，以日期為索引，取代一天一個檔案）
+# --------------------
+LEGACY_TODAY_WORDS_PATTERN = "today_words_*.json"
+LEGACY_TODAY_WORDS_DIR = "today_words.migrated"  # 匯入後舊檔集中搬到這裡
+
+def today_iso():
+    # 每次呼叫都重新取日期，長時間執行的 server 過了午夜也會換到新的一天
+    return datetime.date.today().isoformat()
+
+def _import_today_word_files(directory):
+    """把舊的 today_words_<日期>.json 匯入 daily_words（每個 process 每位使用者做一次）"""
+    paths = glob.glob(os.path.join(glob.escape(directory), LEGACY_TODAY_WORDS_PATTERN))
+    rows = []
+    for path in paths:
+        day = os.path.basename(path)[len("today_words_"):-len(".json")]
+        try:
+            datetime.date.fromisoformat(day)
+        except ValueError:
+            continue
+        rows.extend((day, i, word) for i, word in enumerate(read_json(path, [])))
+    if paths:
+        with closing(open_stats_db()) as conn, conn:
+            conn.executemany("INSERT OR IGNORE INTO daily_words (day, seq, word) VALUES (?, ?, ?)", rows)
+        archive = os.path.join(directory, LEGACY_TODAY_WORDS_DIR)
+        os.makedirs(archive, exist_ok=True)
+        for path in paths:
+            os.replace(path, os.path.join(archive, os.path.basename(path)))
+            if os.path.exists(path + ".lock"):
+                os.remove(path + ".lock")
+    return True
+
+def _daily_words_ready():
+    user_resource("daily_words_imported", _import_today_word_files)
+
+def load_today_words(day=None):
+    """某一天（預設今天）學的單字，依加入順序；主鍵 (day, seq) 的索引直接定位，不掃資料夾"""
+    _daily_words_ready()
+    with closing(open_stats_db()) as conn:
+        rows = conn.execute("SELECT word FROM daily_words WHERE day = ? ORDER BY seq", (day or today_iso(),)).fetchall()
+    return [r[0] for r in rows]
+
+def save_today_words(words, day=None):
+    _daily_words_ready()
+    day = day or today_iso()
+    with closing(open_stats_db()) as conn, conn:
+        conn.execute("DELETE FROM daily_words WHERE day = ?", (day,))
+        conn.executemany("INSERT INTO daily_words (day, seq, word) VALUES (?, ?, ?)",
+                         [(day, i, word) for i, word in enumerate(words)])
+
+def persist_today_words(words, day=None):
+    day = day or today_iso()  # 送出時就決定是哪一天，背景寫入剛好跨過午夜也不會寫錯天
+    return persistence.submit(lambda words=list(words): save_today_words(words, day))
+
+def load_words_between(start, end):
+    """start ~ end（含，ISO 日期字串）每天學的單字 {日期: [單字]}，依日期排序"""
+    _daily_words_ready()
+    with closing(open_stats_db()) as conn:
+        rows = conn.execute(
+            "SELECT day, word FROM daily_words WHERE day BETWEEN ? AND ? ORDER BY day, seq", (start, end)
+        ).fetchall()
+    by_day = {}
+    for day, word in rows:
+        by_day.setdefault(day, []).append(word)
+    return by_day
+
+# --------------------
+# 測驗紀錄（一行一筆 JSON，只追加不重寫）
+# --------------------
+LOG_NAME = "log"  # 依月份分段：log.YYYY-MM.jsonl
+LOG_FILE = "log.jsonl"  # 分段前的單一檔案，第一次啟動時拆成分段
+LEGACY_LOG_FILE = "log.json"  # 更早的整份陣列格式
+LOG_FSYNC_EVERY = int(os.environ.get("LOG_FSYNC_EVERY", "0"))  # 每幾筆 fsync 一次，0 表示交給作業系統
+HISTORY_KEEP_MONTHS = int(os.environ.get("LKK_HISTORY_KEEP_MONTHS", "3"))  # 最近幾個月（含本月）保留逐筆紀錄
+UNDATED_MONTH = "0000-00"  # 沒有時間欄位的舊紀錄歸到這一段
+
+def remove_with_lock(path):
+    for leftover in (path, path + ".lock"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+def current_month():
+    return datetime.date.today().strftime("%Y-%m")
+
+def month_shift(month, delta):
+    """"2026-10" 往前或往後 delta 個月"""
+    n = int(month[:4]) * 12 + int(month[5:7]) - 1 + delta
+    return f"{n // 12:04d}-{n % 12 + 1:02d}"
+
+def migrate_json_array(legacy_path, path):
+    """把舊版 JSON 陣列檔轉成 JSONL（只做一次，舊檔改名為 .migrated 保留）"""
+    if not os.path.exists(legacy_path):
+        return
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        try:
+            items = json.load(f)
+        except json.JSONDecodeError:
+            items = []
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for item in items:
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+        # 轉換前已經有新格式資料的話接在舊資料後面，維持時間順序
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    out.write(line)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+    os.replace(legacy_path, legacy_path + ".migrated")
+
+class JsonlLog:
+    """append-only 的 JSONL 紀錄檔，寫入一筆只花 O(1)，讀取時逐行串流"""
+
+    def __init__(self, path, legacy_path=None, fsync_every=0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        if legacy_path:
+            with file_lock(path):
+                migrate_json_array(legacy_path, path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, item):
+        line = json.dumps(item, ensure_ascii=False) + "\n"
+        if metrics.enabled:
+            metrics.incr("file_opens")
+            metrics.incr("bytes_written", len(line.encode("utf-8")))
+        with metrics.timer("jsonl_append"), self._lock, file_lock(self.path):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                self._unsynced += 1
+                if self.fsync_every and self._unsynced >= self.fsync_every:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._unsynced = 0
+
+    def __iter__(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            _count_file_read(f)
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 當機時寫到一半的最後一行直接略過
+
+    def clear(self):
+        with self._lock, file_lock(self.path):
+            open(self.path, "w", encoding="utf-8").close()
+            self._unsynced = 0
+
+class SegmentedLog:
+    """依月份分段的 JSONL 紀錄（{name}.YYYY-MM.jsonl），追加只碰本月的分段。
+    超過保留期的分段用 summarize 壓縮成一筆摘要（{name}.summary.jsonl）後刪除，全期統計改讀摘要"""
+
+    def __init__(self, directory, name, summarize, legacy_paths=(), month_of=None, fsync_every=0):
+        self.directory = directory
+        self.name = name
+        self.summarize = summarize
+        self.fsync_every = fsync_every
+        self._segments = {}
+        self._lock = threading.Lock()
+        self._base = os.path.join(directory, name)  # 壓縮、清空、轉換時鎖這個名字
+        self._summary_log = JsonlLog(f"{self._base}.summary.jsonl")
+        self._month = current_month()  # 最近一次追加的月份，換月時順便壓縮
+        self._migrate(legacy_paths, month_of)
+
+    def _segment(self, month):
+        with self._lock:
+            log = self._segments.get(month)
+            if log is None:
+                log = self._segments[month] = JsonlLog(f"{self._base}.{month}.jsonl", fsync_every=self.fsync_every)
+            return log
+
+    def _migrate(self, legacy_paths, month_of):
+        # 分段前的整份檔案（JSON 陣列或 JSONL）依各筆的月份拆開，舊檔改名為 .migrated 保留
+        with file_lock(self._base):
+            for path in legacy_paths:
+                if not os.path.exists(path):
+                    continue
+                items = read_json(path, []) if path.endswith(".json") else JsonlLog(path)
+                by_month = {}
+                for item in items:
+                    by_month.setdefault((month_of and month_of(item)) or UNDATED_MONTH, []).append(item)
+                for month, month_items in by_month.items():
+                    with open(self._segment(month).path, "a", encoding="utf-8") as f:
+                        for item in month_items:
+                            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(path, path + ".migrated")
+
+    def _segment_files(self):
+        start = len(self.name) + 1
+        return sorted((os.path.basename(path)[start:start + 7], path)
+                      for path in glob.glob(f"{glob.escape(self._base)}.????-??.jsonl"))
+
+    def months(self):
+        """還有逐筆紀錄的月份，由舊到新；已壓縮但因為中途當機還沒刪掉的分段不算"""
+        summarized = self.summaries()
+        return [month for month, _ in self._segment_files() if month not in summarized]
+
+    def summaries(self):
+        """已壓縮月份的摘要 {月份: 摘要}"""
+        return {s["month"]: s for s in self._summary_log}
+
+    def exists(self):
+        return self._summary_log.exists() or bool(self.months())
+
+    def append(self, item):
+        # 一律寫進本月的分段（依寫入時間輪替），已經壓縮過的月份不會再冒出新資料
+        month = current_month()
+        if month != self._month:
+            # process 跨月一直開著時，第一次取用排的壓縮早就做過了，換月時再排一次
+            self._month = month
+            outside_resource_lock(lambda: persistence.submit(self.compact))
+        self._segment(month).append(item)
+
+    def __iter__(self):
+        """所有逐筆紀錄（不含已壓縮的月份），由舊到新"""
+        for month in self.months():
+            yield from self._segment(month)
+
+    def compact(self, keep_months=HISTORY_KEEP_MONTHS):
+        """把保留期以前的分段壓縮成摘要再刪掉，回傳壓縮了哪些月份"""
+        cutoff = month_shift(current_month(), -(keep_months - 1))
+        compacted = []
+        with metrics.timer("log_compact"), file_lock(self._base):
+            for month in self.months():
+                if month >= cutoff:
+                    break
+                segment = self._segment(month)
+                summary = self.summarize(segment)
+                summary["month"] = month
+                # 先寫摘要再刪分段：中間當機的話分段會被 months() 略過，下次再刪
+                self._summary_log.append(summary)
+                compacted.append(month)
+            summarized = self.summaries()
+            for month, path in self._segment_files():
+                if month in summarized:
+                    remove_with_lock(path)
+        return compacted
+
+    def clear(self):
+        with file_lock(self._base):
+            for _, path in self._segment_files():
+                remove_with_lock(path)
+            remove_with_lock(self._summary_log.path)
+
+def _compact_in_background(log):
+    # 每個 process 第一次取用時在背景壓縮過期的分段；要在 user_resource 放開鎖之後才排，
+    # 不然佇列滿時這裡等空位，背景執行緒的工作又在等同一把鎖，兩邊互等
+    persistence.submit(log.compact)
+
+def _answer_month(item):
+    answered_at = item.get("answered_at")
+    return answered_at[:7] if answered_at else None
+
+def _answer_log(directory):
+    return SegmentedLog(
+        directory, LOG_NAME, summarize_answers,
+        [os.path.join(directory, LEGACY_LOG_FILE), os.path.join(directory, LOG_FILE)],
+        _answer_month, LOG_FSYNC_EVERY,
+    )
+
+def get_answer_log():
+    # 每位使用者在整個 process 共用同一個物件，舊版 log.json / log.jsonl 只會在第一次取用時轉換
+    return user_resource("answer_log", _answer_log, _compact_in_background)
+
+# --------------------
+# 複習紀錄（每次評分一筆，依月份分段；記憶分析用來算保留率與遺忘時間）
+# --------------------
+REVIEW_LOG_NAME = "review_log"
+
+def summarize_reviews(items):
+    """一個月份的複習摘要（總次數、記得次數、依評分前 level 與依單字 key 分的 [次數, 記得]），壓縮分段時使用"""
+    total = 0
+    remembered = 0
+    levels = {}
+    per_word = {}
+    for item in items:
+        ok = 1 if item["remembered"] else 0
+        total += 1
+        remembered += ok
+        for counts in (levels.setdefault(str(item["old_level"]), [0, 0]), per_word.setdefault(item["key"], [0, 0])):
+            counts[0] += 1
+            counts[1] += ok
+    return {"total": total, "remembered": remembered, "levels": levels, "words": per_word}
+
+def _review_month(item):
+    reviewed_at = item.get("reviewed_at")
+    return reviewed_at[:7] if reviewed_at else None
+
+def _review_log(directory):
+    return SegmentedLog(directory, REVIEW_LOG_NAME, summarize_reviews, month_of=_review_month, fsync_every=LOG_FSYNC_EVERY)
+
+def get_review_log():
+    return user_resource("review_log", _review_log, _compact_in_background)
+
+def review_event(w, remembered, old_level):
+    """一次評分：同時是寫回單字庫的更新（key、level、last_review）與複習紀錄的一筆"""
+    return {
+        "key": word_key(w["word"]),
+        "word": w["word"],
+        "remembered": remembered,
+        "old_level": old_level,
+        "level": w["level"],
+        "last_review": w["last_review"],
+        "reviewed_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def append_review_events(events):
+    log = get_review_log()
+    for event in events:
+        log.append(event)
+
+# --------------------
+# 統計彙總（每答一題就地累加，分析報告直接讀結果）
+# --------------------
+STATS_DB_FILE = "stats.db"
+STATS_TOP_WRONG = 50  # 分析報告列出幾個最常答錯的單字
+STATS_RECENT_DAYS = 30
+
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stats_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total INTEGER NOT NULL,
+    correct INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stats_words (
+    word TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL,
+    errors INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stats_words_errors ON stats_words(errors);
+CREATE TABLE IF NOT EXISTS stats_days (
+    day TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    correct INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quiz_fingerprints (
+    fingerprint TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS daily_words (
+    day TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    PRIMARY KEY (day, seq)
+);
+CREATE TABLE IF NOT EXISTS checkin_state (
+    user TEXT PRIMARY KEY,
+    days INTEGER NOT NULL,
+    streak INTEGER NOT NULL,
+    max_streak INTEGER NOT NULL,
+    last_day TEXT
+);
+"""
+
+def open_stats_db():
+    db_path = user_path(STATS_DB_FILE)
+    first_time = not os.path.exists(db_path)
+    metrics.incr("sqlite_opens")
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(STATS_SCHEMA)
+    if first_time:
+        # 彙總檔不見或第一次使用時，從現有的作答紀錄補算
+        _write_stats_rollup(conn, get_answer_log())
+    return conn
+
+def _answer_day(item):
+    answered_at = item.get("answered_at")
+    return answered_at[:10] if answered_at else None
+
+def record_answer(item):
+    """把一筆作答累加進彙總：總數、單字、當天各一列 UPSERT"""
+    correct = 1 if item["is_correct"] else 0
+    day = _answer_day(item)
+    with closing(open_stats_db()) as conn, conn:
+        conn.execute(
+            "INSERT INTO stats_totals (id, total, correct) VALUES (1, 1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET total = total + 1, correct = correct + excluded.correct",
+            (correct,)
+        )
+        conn.execute(
+            "INSERT INTO stats_words (word, attempts, errors) VALUES (?, 1, ?) "
+            "ON CONFLICT(word) DO UPDATE SET attempts = attempts + 1, errors = errors + excluded.errors",
+            (item["word"], 1 - correct)
+        )
+        if day:
+            conn.execute(
+                "INSERT INTO stats_days (day, total, correct) VALUES (?, 1, ?) "
+                "ON CONFLICT(day) DO UPDATE SET total = total + 1, correct = correct + excluded.correct",
+                (day, correct)
+            )
+
+def aggregate_answers(items, summaries=()):
+    """逐筆累加作答紀錄（再加上已壓縮月份的摘要），回傳 (總題數, 答對數, {單字: [作答, 答錯]}, {日期: [題數, 答對]})"""
+    total = 0
+    correct = 0
+    per_word = {}
+    per_day = {}
+    for summary in summaries:
+        total += summary["total"]
+        correct += summary["correct"]
+        for merged, part in ((per_word, summary["words"]), (per_day, summary["days"])):
+            for name, (a, b) in part.items():
+                counts = merged.setdefault(name, [0, 0])
+                counts[0] += a
+                counts[1] += b
+    for item in items:
+        ok = 1 if item["is_correct"] else 0
+        total += 1
+        correct += ok
+        counts = per_word.setdefault(item["word"], [0, 0])
+        counts[0] += 1
+        counts[1] += 1 - ok
+        day = _answer_day(item)
+        if day:
+            counts = per_day.setdefault(day, [0, 0])
+            counts[0] += 1
+            counts[1] += ok
+    return total, correct, per_word, per_day
+
+def summarize_answers(items):
+    """一個月份的作答摘要，壓縮分段時使用"""
+    total, correct, per_word, per_day = aggregate_answers(items)
+    return {"total": total, "correct": correct, "words": per_word, "days": per_day}
+
+def _write_stats_rollup(conn, answer_log):
+    total, correct, per_word, per_day = aggregate_answers(answer_log, answer_log.summaries().values())
+    with conn:
+        conn.execute("DELETE FROM stats_totals")
+        conn.execute("DELETE FROM stats_words")
+        conn.execute("DELETE FROM stats_days")
+        conn.execute("INSERT INTO stats_totals (id, total, correct) VALUES (1, ?, ?)", (total, correct))
+        conn.executemany("INSERT INTO stats_words (word, attempts, errors) VALUES (?, ?, ?)",
+                         [(w, a, e) for w, (a, e) in per_word.items()])
+        conn.executemany("INSERT INTO stats_days (day, total, correct) VALUES (?, ?, ?)",
+                         [(d, t, c) for d, (t, c) in per_day.items()])
+    return total
+
+def persist_answer(item):
+    """作答交給背景寫入；先累加彙總再追加 log：彙總檔第一次建立時會從 log 補算，順序反過來這題會被算兩次"""
+    def write():
+        record_answer(item)
+        get_answer_log().append(item)
+    return persistence.submit(write)
+
+def rebuild_stats_rollup():
+    """從 log.jsonl 重新計算整份彙總（彙總檔損壞或手動修改紀錄後使用）"""
+    persistence.flush()
+    with closing(open_stats_db()) as conn:
+        return _write_stats_rollup(conn, get_answer_log())
+
+def load_stats_summary():
+    with closing(open_stats_db()) as conn:
+        row = conn.execute("SELECT total, correct FROM stats_totals WHERE id = 1").fetchone()
+        wrong_counts = conn.execute(
+            "SELECT word, errors FROM stats_words WHERE errors > 0 ORDER BY errors DESC, word LIMIT ?",
+            (STATS_TOP_WRONG,)
+        ).fetchall()
+        recent_days = conn.execute(
+            "SELECT day, total, correct FROM stats_days ORDER BY day DESC LIMIT ?",
+            (STATS_RECENT_DAYS,)
+        ).fetchall()
+    total, correct = row if row else (0, 0)
+    return {
+        "total": total,
+        "correct": correct,
+        "wrong_counts": wrong_counts,
+        "recent_days": recent_days[::-1],
+    }
+
+def wrong_counts_frame(summary):
+    """最常答錯的單字表；pandas 到真的要畫表格時才載入"""
+    import pandas as pd
+    return pd.DataFrame(summary["wrong_counts"], columns=["單字", "錯誤次數"])
+
+def recent_days_frame(summary):
+    import pandas as pd
+    return pd.DataFrame(summary["recent_days"], columns=["日期", "題數", "正確題數"]).set_index("日期")
+
+# --------------------
+# 測驗結果（以指紋判斷重複）
+# --------------------
+QUIZ_RESULT_NAME = "quiz_result"  # 依月份分段：quiz_result.YYYY-MM.jsonl
+QUIZ_RESULT_FILE = "quiz_result.json"  # 分段前的整份陣列，第一次啟動時拆成分段
+
+def quiz_fingerprint(total, accuracy, wrong_words, quiz_words):
+    """題數、正確率、錯誤單字、測驗單字（排序後）組成的固定指紋"""
+    canonical = json.dumps([total, accuracy, sorted(wrong_words), sorted(quiz_words)], ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+def _wrong_words(row):
+    wrong = row.get("錯誤單字", "無")
+    return [] if wrong == "無" else wrong.split(", ")
+
+def _result_fingerprint(row):
+    # 舊紀錄沒有存指紋，用欄位重新算
+    if row.get("指紋"):
+        return row["指紋"]
+    return quiz_fingerprint(row.get("題數"), row.get("正確率"), _wrong_words(row), row.get("單字列表", []))
+
+def summarize_quiz_results(rows):
+    """一個月份的測驗摘要：次數、題數、答對題數與最常錯的單字"""
+    quizzes = questions = correct = 0
+    wrong = Counter()
+    for row in rows:
+        total = row.get("題數") or 0
+        quizzes += 1
+        questions += total
+        correct += round(total * float(str(row.get("正確率", "0")).rstrip("%") or 0) / 100)
+        wrong.update(_wrong_words(row))
+    return {"quizzes": quizzes, "questions": questions, "correct": correct,
+            "wrong_words": dict(wrong.most_common(STATS_TOP_WRONG))}
+
+def _quiz_month(row):
+    finished_at = row.get("測驗時間")
+    return finished_at[:7] if finished_at else None
+
+def _quiz_log(directory):
+    return SegmentedLog(directory, QUIZ_RESULT_NAME, summarize_quiz_results,
+                        [os.path.join(directory, QUIZ_RESULT_FILE)], _quiz_month)
+
+def get_quiz_log():
+    return user_resource("quiz_log", _quiz_log, _compact_in_background)
+
+def load_quiz_results():
+    """保留期內的逐筆測驗結果（由舊到新），更早的請看 load_quiz_summaries"""
+    return list(get_quiz_log())
+
+def load_quiz_summaries():
+    """已壓縮月份的測驗摘要，由舊到新"""
+    return sorted(get_quiz_log().summaries().values(), key=lambda s: s["month"])
+
+def has_quiz_results():
+    return get_quiz_log().exists()
+
+def _backfill_quiz_fingerprints(conn):
+    # 指紋表是空的但已有測驗結果時（第一次升級），補上舊紀錄的指紋
+    if conn.execute("SELECT 1 FROM quiz_fingerprints LIMIT 1").fetchone():
+        return
+    conn.executemany(
+        "INSERT OR IGNORE INTO quiz_fingerprints (fingerprint) VALUES (?)",
+        [(_result_fingerprint(r),) for r in load_quiz_results()]
+    )
+
+def save_quiz_result(result_row):
+    """指紋沒出現過才追加到本月的測驗結果分段，回傳是否有寫入"""
+    with closing(open_stats_db()) as conn, conn:
+        _backfill_quiz_fingerprints(conn)
+        cur = conn.execute("INSERT OR IGNORE INTO quiz_fingerprints (fingerprint) VALUES (?)", (result_row["指紋"],))
+        if cur.rowcount == 0:
+            return False
+    get_quiz_log().append(result_row)
+    return True
+
+def persist_quiz_result(result_row):
+    return persistence.submit(lambda: save_quiz_result(result_row))
+
+def clear_quiz_results():
+    persistence.flush()  # 還在佇列裡的結果寫完再清，才不會清完又冒出來
+    get_quiz_log().clear()
+    with closing(open_stats_db()) as conn, conn:
+        conn.execute("DELETE FROM quiz_fingerprints")
+
+# --------------------
+# 打卡紀錄（JSONL）與每位使用者的連續打卡狀態
+# --------------------
+CHECKIN_FILE = "checkin.jsonl"
+LEGACY_CHECKIN_FILE = "checkin.json"
+
+def _checkin_log(directory):
+    return JsonlLog(os.path.join(directory, CHECKIN_FILE), os.path.join(directory, LEGACY_CHECKIN_FILE))
+
+def get_checkin_log():
+    return user_resource("checkin_log", _checkin_log)
+
+def _advance_streak(state, day):
+    """把某一天的打卡併入狀態（days, streak, max_streak, last_day）；同一天重複打卡不重算"""
+    days, streak, max_streak, last_day = state
+    if last_day == day:
+        return state
+    if last_day is not None and day < last_day:
+        return state  # 比最後一天還早的補登只能靠重建處理
+    if last_day is not None and (datetime.date.fromisoformat(day) - datetime.date.fromisoformat(last_day)).days == 1:
+        streak += 1
+    else:
+        streak = 1
+    return (days + 1, streak, max(max_streak, streak), day)
+
+def checkin_streaks(records):
+    """從打卡紀錄算出每位使用者的 (累積天數, 連續天數, 最長連續天數, 最後打卡日)"""
+    states = {}
+    for user, day in sorted({(c.get("user", ""), c["datetime"][:10]) for c in records}):
+        states[user] = _advance_streak(states.get(user, (0, 0, 0, None)), day)
+    return states
+
+def current_streak(state, today=None):
+    # 最後打卡日不是今天或昨天，目前連續天數就已經中斷
+    days, streak, max_streak, last_day = state
+    today = today or datetime.date.today()
+    if last_day is None or (today - datetime.date.fromisoformat(last_day)).days > 1:
+        return 0
+    return streak
+
+def _rebuild_checkin_state(conn):
+    states = checkin_streaks(get_checkin_log())
+    with conn:
+        conn.execute("DELETE FROM checkin_state")
+        conn.executemany(
+            "INSERT INTO checkin_state (user, days, streak, max_streak, last_day) VALUES (?, ?, ?, ?, ?)",
+            [(user,) + state for user, state in states.items()]
+        )
+
+def _load_checkin_state(conn, user):
+    # 狀態表是空的但已有打卡紀錄時（第一次升級），先從紀錄重建
+    if not conn.execute("SELECT 1 FROM checkin_state LIMIT 1").fetchone() and get_checkin_log().exists():
+        _rebuild_checkin_state(conn)
+    row = conn.execute(
+        "SELECT days, streak, max_streak, last_day FROM checkin_state WHERE user = ?", (user,)
+    ).fetchone()
+    return tuple(row) if row else (0, 0, 0, None)
+
+def record_checkin(record):
+    """追加一筆打卡並更新該使用者的累積天數與連續天數"""
+    get_checkin_log().append(record)
+    with closing(open_stats_db()) as conn, conn:
+        state = _advance_streak(_load_checkin_state(conn, record["user"]), record["datetime"][:10])
+        conn.execute(
+            "INSERT OR REPLACE INTO checkin_state (user, days, streak, max_streak, last_day) VALUES (?, ?, ?, ?, ?)",
+            (record["user"],) + state
+        )
+
+def persist_checkin(record):
+    return persistence.submit(lambda: record_checkin(record))
+
+def load_checkin_state(user):
+    with closing(open_stats_db()) as conn:
+        state = _load_checkin_state(conn, user)
+    days, _, max_streak, last_day = state
+    return {"days": days, "streak": current_streak(state), "max_streak": max_streak, "last_day": last_day}
+
+def clear_checkins():
+    persistence.flush()
+    get_checkin_log().clear()
+    with closing(open_stats_db()) as conn, conn:
+        conn.execute("DELETE FROM checkin_state")
+
+# --------------------
+# 複習評分暫存（write-behind）：先記在 session 與 journal，湊滿一批再寫回
+# --------------------
+REVIEW_JOURNAL_PREFIX = "review_pending_"
+REVIEW_FLUSH_SIZE = 20  # 累積幾筆評分就寫回
+REVIEW_FLUSH_SECONDS = 30  # 最早一筆暫存超過幾秒就寫回
+
+def review_journal_path(session_id):
+    return user_path(f"{REVIEW_JOURNAL_PREFIX}{session_id}.jsonl")
+
+_live_journals = {}  # 本 process 的 session 正在寫的 journal 路徑 → 持有共用鎖的檔案
+_live_journals_lock = threading.Lock()
+
+def open_review_journal(session_id):
+    """session 要寫的 journal：在寫回並刪除之前一直持有共用鎖，
+    別的 process 重播遺留的 journal 時拿不到獨佔鎖，就知道這個 session 還活著而跳過"""
+    path = review_journal_path(session_id)
+    if fcntl is None:
+        return path
+    with _live_journals_lock:
+        if path in _live_journals:
+            return path
+        while True:
+            f = open(path, "a", encoding="utf-8")
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()  # 建好還沒上鎖就被別的 process 當成遺留的 journal 刪掉了，重開一個
+        _live_journals[path] = f
+    return path
+
+def _release_journal(path):
+    with _live_journals_lock:
+        f = _live_journals.pop(path, None)
+    if f is not None:
+        f.close()
+
+def remove_journal(path):
+    # journal 只屬於一個 session，連同它的 .lock 檔一起刪掉；先刪再放開鎖，別的 process 才不會在中間重播
+    remove_with_lock(path)
+    _release_journal(path)
+
+@contextmanager
+def _claim_journal(path):
+    """試著取得 journal 的獨佔鎖；還有 session 在寫（有人持有共用鎖）或已經被刪掉時得到 False"""
+    if fcntl is None:
+        yield True
+        return
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        yield False
+        return
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            claimed = os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+        except FileNotFoundError:
+            claimed = False
+        yield claimed
+
+def replay_review_journals():
+    """把沒寫回的 journal（當機、session 直接關掉）套用到單字庫後刪除；還有 session 在寫的不動"""
+    for path in glob.glob(user_path(f"{REVIEW_JOURNAL_PREFIX}*.jsonl")):
+        with _claim_journal(path) as claimed:
+            if not claimed:
+                continue
+            entries = list(JsonlLog(path))
+            latest = {}
+            for entry in entries:
+                latest[entry["key"]] = entry
+            save_review_updates(list(latest.values()))
+            append_review_events([e for e in entries if "reviewed_at" in e])
+            remove_with_lock(path)
+
+def _release_live_journals(directory):
+    # 程式結束：本 process 的 session 都不會再寫了，放開它們的鎖讓重播接手
+    with _live_journals_lock:
+        files = [_live_journals.pop(p) for p in list(_live_journals) if os.path.dirname(p) == directory]
+    for f in files:
+        f.close()
+
+def _replay_review_journals_for(user):
+    # 佇列裡的評分比 journal 舊，先寫完才不會蓋掉 journal 裡較新的結果
+    persistence.flush()
+    with acting_user(user):
+        _release_live_journals(user_dir())
+        replay_review_journals()
+
+def recover_review_journals(user):
+    # 每位使用者在每個 process 第一次登入時套用上次留下的 journal，正常關閉時再把還在暫存的寫回
+    with acting_user(user):
+        return user_resource("journals_recovered", lambda directory: _recover_review_journals(user))
+
+def _recover_review_journals(user):
+    replay_review_journals()
+    atexit.register(_replay_review_journals_for, user)
+    return True
+
+class _ReviewBuffer:
+    """一個 session 暫存、還沒寫回的評分：同一個單字只留最後一次，複習紀錄則每次都留"""
+    __slots__ = ("user", "path", "since", "pending", "events")
+
+    def __init__(self, user, path):
+        self.user = user
+        self.path = path  # 每一批各用一個 journal，寫回後只刪這一批的
+        self.since = time.time()
+        self.pending = {}
+        self.events = []
+
+_review_buffers = {}  # (使用者資料夾, session id) → _ReviewBuffer
+_review_buffers_lock = threading.Lock()
+
+def buffer_review_change(session_id, entry):
+    """先寫 journal 再放進暫存，程式中途當掉也不會遺失評分；回傳這個 session 暫存了幾個單字。
+    暫存放在 process 裡而不是 session 裡，閒置或已關閉的分頁也能由別人的操作或背景執行緒寫回"""
+    key = (user_dir(), session_id)
+    with _review_buffers_lock:
+        buffer = _review_buffers.get(key)
+        if buffer is None:
+            buffer = _review_buffers[key] = _ReviewBuffer(_acting.user, open_review_journal(uuid.uuid4().hex))
+        JsonlLog(buffer.path).append(entry)
+        buffer.pending[entry["key"]] = entry
+        buffer.events.append(entry)
+        count = len(buffer.pending)
+    persistence.ensure_running()  # 定期檢查閒置的暫存要靠背景執行緒
+    return count
+
+def _take_review_buffers(match):
+    # 拿走之後別的 session 再評分就開新的一批，同一筆評分不會被寫回兩次
+    with _review_buffers_lock:
+        keys = [key for key, buffer in _review_buffers.items() if match(key, buffer)]
+        return [_review_buffers.pop(key) for key in keys]
+
+def _persist_review_buffers(buffers):
+    queued = True
+    for buffer in buffers:
+        with acting_user(buffer.user):
+            queued = persist_review_updates(list(buffer.pending.values()), buffer.path, buffer.events) and queued
+    return queued
+
+def flush_review_buffer(session_id):
+    """把這個 session 暫存的評分交給背景寫回；回傳是否不必等待就排進佇列"""
+    key = (user_dir(), session_id)
+    return _persist_review_buffers(_take_review_buffers(lambda k, buffer: k == key))
+
+def flush_stale_review_buffers(max_age=REVIEW_FLUSH_SECONDS, all_users=False):
+    """本 process 裡暫存超過 max_age 秒的評分都寫回，不管是哪個 session 的；預設只看目前的使用者"""
+    directory = None if all_users else user_dir()
+    cutoff = time.time() - max_age
+    return _persist_review_buffers(_take_review_buffers(
+        lambda key, buffer: (directory is None or key[0] == directory) and buffer.since <= cutoff
+    ))
+
+persistence.add_periodic(lambda: flush_stale_review_buffers(all_users=True))
+
+# --------------------
+# 跨 session 共用的單字快照（copy-on-write）
+# --------------------
+class SharedVocab:
+    """整個 process 只存一份單字。單字的 dict 建好後就不再原地修改；清單依加入順序存在 _slots，
+    刪除時只在原位置留下 None（tombstone），不搬動後面的單字。讀取端拿到的 words 是另外整理出來的 list，
+    版本號變了才重新整理，正在讀舊版本的 session 不受影響"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = 0  # 每次異動加一，words 用它判斷整理好的 list 是否過期
+        self._storage_version = None
+        self._writes_in_flight = 0
+        self._slots = []
+        self._slot_keys = []  # 跟 _slots 對齊的 key，壓縮時不必重算 word_key
+        self._positions = {}  # key → 在 _slots 的位置
+        self._dead = 0
+        self._words = []
+        self._words_version = 0
+        self._derived = {}
+
+    def _replace(self, words):
+        self._slots = list(words)
+        self._slot_keys = [word_key(w["word"]) for w in self._slots]
+        self._positions = {key: i for i, key in enumerate(self._slot_keys)}
+        self._dead = 0
+        self._derived = {}
+        self.version += 1
+
+    @property
+    def words(self):
+        """目前的單字快照（依加入順序），只能讀不能改；有異動後第一次讀取時才整理出新的 list"""
+        if self._words_version != self.version:
+            with self.lock:
+                if self._words_version != self.version:
+                    self._words = [w for w in self._slots if w is not None] if self._dead else list(self._slots)
+                    self._words_version = self.version
+        return self._words
+
+    def __len__(self):
+        return len(self._slots) - self._dead
+
+    def current_words(self):
+        """儲存檔被別的 process 改過（版本號不同）才重新讀取，否則直接回傳目前的快照"""
+        storage_version = words_version()
+        # 自己送出的寫入還沒寫完時，檔案只寫了一部分，不能拿來重新讀取
+        if storage_version != self._storage_version and not self._writes_in_flight:
+            with self.lock:
+                if storage_version != self._storage_version and not self._writes_in_flight:
+                    self._replace(_read_words())
+                    self._storage_version = storage_version
+        return self.words
+
+    def mark_saved(self):
+        # 寫入的內容已經在快照裡，不必因為儲存版本號變了而重新讀取
+        with self.lock:
+            self._storage_version = words_version()
+
+    def persist(self, write, *args):
+        """快照已經換好，寫檔交給背景執行緒；寫完才記下新的儲存版本"""
+        with self.lock:
+            self._writes_in_flight += 1
+
+        def job():
+            try:
+                write(*args)
+            finally:
+                with self.lock:
+                    self._writes_in_flight -= 1
+                    self.mark_saved()
+        return persistence.submit(job)
+
+    def derived(self, name):
+        with self.lock:
+            obj = self._derived.get(name)
+            if obj is None:
+                obj = self._derived[name] = WORD_DERIVED_BUILDERS[name](self.words)
+            return obj
+
+    def get(self, key):
+        return self.derived("index").get(key)
+
+    def put_many(self, items):
+        """換上新版本的單字（新增或修改），items 是 (新的 dict, 舊 key 或 None)；只改動到的那幾格，不複製整份清單"""
+        with self.lock:
+            for w, old_key in items:
+                key = word_key(w["word"])
+                pos = self._positions.pop(old_key if old_key is not None else key, None)
+                if pos is None:
+                    pos = len(self._slots)
+                    self._slots.append(w)
+                    self._slot_keys.append(key)
+                else:
+                    self._slots[pos] = w
+                    self._slot_keys[pos] = key
+                self._positions[key] = pos
+                self._update_derived(w, old_key)
+            self.version += 1
+
+    def put(self, w, old_key=None):
+        self.put_many([(w, old_key)])
+
+    def remove(self, key):
+        with self.lock:
+            pos = self._positions.pop(key, None)
+            if pos is None:
+                return
+            self._slots[pos] = None
+            self._slot_keys[pos] = None
+            self._dead += 1
+            if self._dead > 1024 and self._dead * 2 > len(self._slots):
+                self._compact()
+            for name in INCREMENTAL_DERIVED:
+                if name in self._derived:
+                    self._derived[name].remove(key)
+            if "index" in self._derived:
+                self._derived["index"].pop(key, None)
+            self.version += 1
+
+    def _compact(self):
+        # 刪除標記太多時才整理一次，位置表用對齊的 key 重建
+        alive = [i for i, w in enumerate(self._slots) if w is not None]
+        self._slots = [self._slots[i] for i in alive]
+        self._slot_keys = [self._slot_keys[i] for i in alive]
+        self._positions = {key: i for i, key in enumerate(self._slot_keys)}
+        self._dead = 0
+
+    def replace_all(self, words):
+        with self.lock:
+            self._replace(list(words))
+
+    def apply_review_updates(self, updates):
+        items = []
+        for u in updates:
+            w = self.get(u["key"])
+            if w is not None and (w.get("level"), w.get("last_review")) != (u["level"], u["last_review"]):
+                items.append((dict(w, level=u["level"], last_review=u["last_review"]), None))
+        if items:
+            self.put_many(items)
+
+    def _update_derived(self, w, old_key):
+        index = self._derived.get("index")
+        if index is not None:
+            if old_key is not None:
+                index.pop(old_key, None)
+            index[word_key(w["word"])] = w
+        for name in INCREMENTAL_DERIVED:
+            if name in self._derived:
+                self._derived[name].update(w, old_key)
+
+def get_shared_vocab():
+    # 每位使用者一份，同一個使用者的所有 session 共用
+    return user_resource("shared_vocab", lambda directory: SharedVocab())
+
+def get_words():
+    """目前的單字快照，所有 session 共用，只能讀不能改"""
+    return get_shared_vocab().words
+
+def word_count():
+    """只要單字數時用這個，剛有異動也不必整理出整份快照"""
+    return len(get_shared_vocab())
+
+# --------------------
+# 單字索引（正規化單字 → 單字資料，查詢 O(1)）與其他衍生結構
+# --------------------
+def build_word_index(words):
+    return {word_key(w["word"]): w for w in words}
+
+WORD_DERIVED_BUILDERS = {
+    "index": build_word_index,
+    "scheduler": lambda words: ReviewScheduler(words),
+    "search": lambda words: WordSearchIndex(words),
+    "columns": lambda words: WordColumns(words),
+    "distractors": lambda words: DistractorIndex(words),
+}
+INCREMENTAL_DERIVED = ("scheduler", "search", "columns", "distractors")  # 有 update/remove，異動時就地更新而不是重建
+
+def get_word_derived(name):
+    # 由單字快照衍生的結構跟著共用快照走，整份換掉（例如清空）時才重建
+    return get_shared_vocab().derived(name)
+
+def get_word_index():
+    return get_word_derived("index")
+
+def find_word(word):
+    return get_shared_vocab().get(word_key(word))
+
+def add_or_update_word(word, meaning):
+    """新增單字；已存在就只更新意思。回傳單字資料"""
+    store = get_shared_vocab()
+    exist = find_word(word)
+    if exist:
+        exist = dict(exist, meaning=meaning)  # 更新意思
+    else:
+        exist = {
+            "word": word,
+            "meaning": meaning,
+            "level": 1,
+            "last_review": datetime.date.today().isoformat()
+        }
+    store.put(exist)
+    store.persist(save_word, exist)
+    return exist
+
+def rename_word(w, new_word):
+    store = get_shared_vocab()
+    old_key = word_key(w["word"])
+    w = dict(w, word=new_word)
+    store.put(w, old_key)
+    store.persist(save_word, w, old_key)
+
+def update_meaning(w, new_meaning):
+    store = get_shared_vocab()
+    w = dict(w, meaning=new_meaning)
+    store.put(w)
+    store.persist(save_word, w)
+
+def remove_word(w):
+    store = get_shared_vocab()
+    store.remove(word_key(w["word"]))
+    store.persist(delete_word, w)
+
+def replace_all_words(words):
+    store = get_shared_vocab()
+    store.replace_all(words)
+    store.persist(save_words, store.words)
+
+def persist_review_updates(updates, journal_path=None, events=()):
+    """把一批複習評分套進快照，寫回單字庫、追加複習紀錄後再刪掉對應的 journal"""
+    store = get_shared_vocab()
+    store.apply_review_updates(updates)  # 暫存期間若快照被重新載入過，把評分補回去
+    events = list(events)
+
+    def write():
+        save_review_updates(updates)
+        append_review_events(events)
+        if journal_path:
+            remove_journal(journal_path)
+    return store.persist(write)
+
+# --------------------
+# 批次匯入／匯出（CSV、TSV、JSONL，逐列串流處理）
+# --------------------
+EXPORT_FIELDS = ("word", "meaning", "level", "last_review")
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_POLICIES = ("skip", "overwrite", "append")  # 單字已存在時：保留原意思、改成新意思、合併兩邊的意思
+MEANING_SEPARATOR = "；"
+
+def word_file_format(name):
+    """依副檔名判斷格式，認不得就當成 CSV"""
+    ext = os.path.splitext(name)[1].lower().lstrip(".")
+    return ext if ext in ("tsv", "jsonl") else "csv"
+
+def iter_word_rows(stream, fmt):
+    """逐列讀出 {word, meaning[, level, last_review]}；CSV/TSV 第一列是 word 開頭就當表頭，否則依欄位順序"""
+    if fmt == "jsonl":
+        for line in stream:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield row if isinstance(row, dict) else {}
+        return
+    fields = EXPORT_FIELDS
+    for i, cells in enumerate(csv.reader(stream, delimiter="\t" if fmt == "tsv" else ",")):
+        if i == 0 and cells and cells[0].strip().lower() == "word":
+            fields = tuple(c.strip().lower() for c in cells)
+            continue
+        if any(c.strip() for c in cells):
+            yield dict(zip(fields, cells))
+
+def _imported_word(row, today):
+    word = str(row.get("word") or "").strip().lower()
+    meaning = str(row.get("meaning") or "").strip()
+    if not word or not meaning:
+        return None
+    w = {"word": word, "meaning": meaning, "level": 1, "last_review": today}
+    try:
+        w["level"] = min(max(int(row.get("level") or 1), 1), MAX_LEVEL)
+    except (TypeError, ValueError):
+        pass
+    if "last_review" in row:
+        # 匯出檔裡空白代表還沒複習過
+        try:
+            w["last_review"] = datetime.date.fromisoformat(str(row["last_review"]).strip()).isoformat()
+        except ValueError:
+            w["last_review"] = None
+    return w
+
+def merge_meanings(old, new):
+    parts = [m for m in old.split(MEANING_SEPARATOR) if m]
+    for m in new.split(MEANING_SEPARATOR):
+        if m and m not in parts:
+            parts.append(m)
+    return MEANING_SEPARATOR.join(parts)
+
+def import_words(stream, fmt="csv", policy="skip", chunk_size=IMPORT_CHUNK_SIZE):
+    """串流讀入單字檔，每 chunk_size 列比對一次現有單字；整份檔案讀完才一次套進快照並寫檔。
+    已存在的單字只依 policy 處理意思，等級與複習日期保留原本的進度。回傳各類筆數"""
+    if policy not in IMPORT_POLICIES:
+        raise ValueError(f"unknown import policy: {policy}")
+    store = get_shared_vocab()
+    store.current_words()
+    index = get_word_index()
+    today = datetime.date.today().isoformat()
+    pending = {}  # 正規化 key → 要寫入的單字（檔案內重複的也在這裡合併）
+    counts = {"added": 0, "updated": 0, "skipped": 0, "invalid": 0}
+    with metrics.timer("words_import"):
+        rows = iter_word_rows(stream, fmt)
+        while True:
+            chunk = [r for _, r in zip(range(chunk_size), rows)]
+            if not chunk:
+                break
+            for row in chunk:
+                w = _imported_word(row, today)
+                if w is None:
+                    counts["invalid"] += 1
+                    continue
+                key = word_key(w["word"])
+                exist = pending.get(key) or index.get(key)
+                if exist is None:
+                    pending[key] = w
+                    continue
+                if policy == "skip":
+                    counts["skipped"] += 1
+                    continue
+                meaning = w["meaning"] if policy == "overwrite" else merge_meanings(exist["meaning"], w["meaning"])
+                if meaning == exist["meaning"]:
+                    counts["skipped"] += 1
+                    continue
+                pending[key] = dict(exist, meaning=meaning)
+        for key in pending:
+            counts["updated" if key in index else "added"] += 1
+        if pending:
+            changed = list(pending.values())
+            store.put_many([(w, None) for w in changed])
+            store.persist(save_many_words, changed)
+    return counts
+
+def export_words(stream, fmt="csv", words=None):
+    """把單字逐列寫到 stream，格式與 import_words 相容。回傳筆數"""
+    words = get_words() if words is None else words
+    if fmt == "jsonl":
+        for w in words:
+            stream.write(json.dumps({k: w.get(k) for k in EXPORT_FIELDS}, ensure_ascii=False) + "\n")
+        return len(words)
+    writer = csv.writer(stream, delimiter="\t" if fmt == "tsv" else ",", lineterminator="\n")
+    writer.writerow(EXPORT_FIELDS)
+    for w in words:
+        writer.writerow([w.get("word"), w.get("meaning"), w.get("level", 1), w.get("last_review") or ""])
+    return len(words)
+
+# --------------------
+# 選擇題測驗功能
+# --------------------
+DISTRACTOR_COUNT = 3
+
+def sample_distractor_words(words, answer, k=DISTRACTOR_COUNT, rng=random, exclude=()):
+    """從單字清單中依索引隨機抽當干擾選項的單字，抽到正確答案或重複的意思就重抽"""
+    chosen = []
+    seen = {answer, *exclude}
+    attempts = 0
+    while len(chosen) < k and attempts < k * 10:
+        attempts += 1
+        w = words[rng.randrange(len(words))]
+        meaning = w["meaning"]
+        if not meaning or meaning in seen:
+            continue
+        seen.add(meaning)
+        chosen.append(w)
+    if len(chosen) < k:
+        # 有效意思太少、一直抽不到時才退回完整掃描
+        rest = {}
+        for w in words:
+            if w["meaning"] and w["meaning"] not in seen:
+                rest.setdefault(w["meaning"], w)
+        chosen += rng.sample(list(rest.values()), min(k - len(chosen), len(rest)))
+    return chosen
+
+def sample_distractors(words, answer, k=DISTRACTOR_COUNT, rng=random, exclude=()):
+    return [w["meaning"] for w in sample_distractor_words(words, answer, k, rng, exclude)]
+
+def _is_cjk(ch):
+    return "\u4e00" <= ch <= "\u9fff"
+
+class _KeyBag:
+    """可以 O(1) 加入、刪除、隨機抽一個的 key 集合（list 加位置表，刪除時拿最後一個補位）"""
+    __slots__ = ("keys", "pos")
+
+    def __init__(self):
+        self.keys = []
+        self.pos = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        if key not in self.pos:
+            self.pos[key] = len(self.keys)
+            self.keys.append(key)
+
+    def discard(self, key):
+        i = self.pos.pop(key, None)
+        if i is None:
+            return
+        last = self.keys.pop()
+        if last != key:
+            self.keys[i] = last
+            self.pos[last] = i
+
+    def choice(self, rng):
+        return self.keys[rng.randrange(len(self.keys))]
+
+class DistractorIndex:
+    """容易混淆的干擾選項：意思有相同中文字的、英文長度相同的、level 相同的單字各自分組。
+    出題時依序從這幾組隨機抽，每抽一個是 O(1)，不必掃過所有意思；單字異動時只搬動那一個單字"""
+
+    def __init__(self, words=()):
+        self._entries = {}  # key → (意思, 分組 key 的 tuple)
+        self._groups = {}  # 分組 key → _KeyBag
+        for w in words:
+            self.update(w)
+
+    @staticmethod
+    def _group_keys(w):
+        chars = dict.fromkeys(ch for ch in w.get("meaning") or "" if _is_cjk(ch))
+        return tuple(("char", ch) for ch in chars) + (("len", len(w["word"])), ("level", w.get("level", 1)))
+
+    def update(self, w, old_key=None):
+        self.remove(old_key if old_key is not None else word_key(w["word"]))
+        if not w.get("meaning"):
+            return  # 沒有意思的單字不能當干擾選項
+        key = word_key(w["word"])
+        groups = self._group_keys(w)
+        self._entries[key] = (w["meaning"], groups)
+        for g in groups:
+            bag = self._groups.get(g)
+            if bag is None:
+                bag = self._groups[g] = _KeyBag()
+            bag.add(key)
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for g in entry[1]:
+            bag = self._groups[g]
+            bag.discard(key)
+            if not bag:
+                del self._groups[g]
+
+    def distractors(self, w, k=DISTRACTOR_COUNT, rng=random, exclude=()):
+        """最多 k 個跟 w 的意思不同、彼此也不重複的意思；相同中文字的組優先，再來是長度、level"""
+        return [meaning for _, meaning in self.distractor_keys(w, k, rng, exclude)]
+
+    def distractor_keys(self, w, k=DISTRACTOR_COUNT, rng=random, exclude=()):
+        """同 distractors，但回傳 (單字 key, 意思)，讓測驗進度可以只存 key"""
+        seen = {w["meaning"], *exclude}
+        chosen = []
+        groups = self._group_keys(w)
+        chars = list(groups[:-2])
+        rng.shuffle(chars)  # 意思裡每個字輪流當優先的組，不要永遠是第一個字
+        for g in chars + list(groups[-2:]):
+            bag = self._groups.get(g)
+            if bag is None:
+                continue
+            for _ in range(min(len(bag), k * 2)):
+                key = bag.choice(rng)
+                meaning = self._entries[key][0]
+                if meaning not in seen:
+                    seen.add(meaning)
+                    chosen.append((key, meaning))
+                    break  # 每組先拿一個，讓選項來自不同的相似處
+            if len(chosen) == k:
+                return chosen
+        return chosen
+
+def generate_choice_questions(words, num_questions=None, rng=random, distractors=None):
+    """先抽出要考的單字再產生選項，花費只跟題數有關；num_questions 為 None 時考全部單字。
+    distractors 是這份單字的 DistractorIndex，沒給就從所有意思隨機抽"""
+    questions = []
+    if len(words) < 2:
+        return questions  # 至少要兩個單字才有干擾選項
+    if num_questions is None or num_questions > len(words):
+        num_questions = len(words)
+    for w in rng.sample(words, num_questions):
+        questions.append(choice_question(w, words, rng, distractors))
+    return questions
+
+def choice_question(w, words, rng=random, distractors=None, chosen=()):
+    """chosen 是已經決定好的干擾選項（意思），不夠的才另外抽"""
+    options = [w["meaning"]]
+    for meaning in chosen:
+        if meaning and meaning not in options and len(options) <= DISTRACTOR_COUNT:
+            options.append(meaning)
+    if distractors is not None and len(options) <= DISTRACTOR_COUNT:
+        options += distractors.distractors(w, DISTRACTOR_COUNT + 1 - len(options), rng, options)
+    if len(options) <= DISTRACTOR_COUNT:
+        # 相似的組湊不滿時，剩下的從所有意思隨機補
+        options += sample_distractors(words, w["meaning"], DISTRACTOR_COUNT + 1 - len(options), rng, options)
+    rng.shuffle(options)
+    return {
+        "word": w["word"],
+        "options": options,
+        "answer_index": options.index(w["meaning"])
+    }
+
+# --------------------
+# 測驗進度（只存種子、單字 key 與作答的選項編號，題目需要時再重新產生）
+# --------------------
+QUIZ_STATE_FILE = "quiz_state.json"  # 每位使用者最近一次沒做完的測驗，重新整理頁面後可以接著做
+
+def new_quiz(words, num_questions, rng=random):
+    """抽出要考的單字，回傳精簡的測驗狀態：
+    seed 決定每題選項的順序，keys 是題目單字，distractors 是每題干擾選項的單字 key，
+    choices 是已作答的選項編號（-1 代表題目單字已被刪除而跳過），correct 是答對題目的 bitmask。
+    干擾選項在開始時就抽好存起來：索引裡的抽選跟著單字異動改變，重新抽的話別的單字一複習選項就變了"""
+    if len(words) < 2:
+        return None  # 至少要兩個單字才有干擾選項
+    num_questions = min(num_questions, len(words))
+    seed = rng.randrange(2 ** 31)
+    chosen = rng.sample(words, num_questions)
+    store = get_shared_vocab()
+    with store.lock:
+        index = store.derived("distractors")
+        distractors = [_quiz_distractor_keys(w, words, random.Random(f"{seed}:{i}"), index)
+                       for i, w in enumerate(chosen)]
+    return {
+        "seed": seed,
+        "keys": [word_key(w["word"]) for w in chosen],
+        "distractors": distractors,
+        "choices": [],
+        "correct": 0,
+        "finished_at": None,
+    }
+
+def _quiz_distractor_keys(w, words, rng, index):
+    picked = index.distractor_keys(w, rng=rng)
+    if len(picked) < DISTRACTOR_COUNT:
+        extra = sample_distractor_words(words, w["meaning"], DISTRACTOR_COUNT - len(picked), rng,
+                                        [meaning for _, meaning in picked])
+        picked += [(word_key(d["word"]), d["meaning"]) for d in extra]
+    return [key for key, _ in picked]
+
+def quiz_question(state, position):
+    """依存下的干擾選項與種子重新產生第 position 題；這四個單字沒被修改、刪除就跟第一次看到的一模一樣。
+    題目單字已被刪除時回傳 None"""
+    w = find_word(state["keys"][position])
+    if w is None:
+        return None
+    rng = random.Random(f"{state['seed']}:{position}")
+    store = get_shared_vocab()
+    with store.lock:  # 干擾選項索引會被其他 session 的新增、修改就地更新
+        picked = state.get("distractors")
+        if picked is None:  # 舊格式的進度沒有存干擾選項，只能重新抽
+            return choice_question(w, store.words, rng, store.derived("distractors"))
+        chosen = [d["meaning"] for d in map(store.get, picked[position]) if d is not None]
+        # 干擾選項的單字被刪除或意思撞在一起時才另外補抽
+        return choice_question(w, store.words, rng, store.derived("distractors"), chosen)
+
+def quiz_position(state):
+    return len(state["choices"])
+
+def quiz_done(state):
+    return quiz_position(state) >= len(state["keys"])
+
+def answer_quiz(state, choice):
+    """記下目前這題選的選項編號（None 代表跳過），回傳 (新的狀態, 題目, 是否答對)"""
+    position = quiz_position(state)
+    question = quiz_question(state, position)
+    correct = question is not None and choice == question["answer_index"]
+    state = dict(state, choices=state["choices"] + [-1 if choice is None else choice])
+    if correct:
+        state["correct"] |= 1 << position
+    return state, question, correct
+
+def quiz_score(state):
+    """(答對題數, 有作答的題數, 答錯的單字)；跳過的題目不算"""
+    answered = [i for i, c in enumerate(state["choices"]) if c >= 0]
+    wrong = [state["keys"][i] for i in answered if not state["correct"] >> i & 1]
+    return bin(state["correct"]).count("1"), len(answered), wrong
+
+def load_quiz_state():
+    state = read_json(user_path(QUIZ_STATE_FILE), None)
+    if not state or quiz_done(state):
+        return None
+    return state
+
+def save_quiz_state(state):
+    path = user_path(QUIZ_STATE_FILE)
+    with file_lock(path):
+        if state is None:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            atomic_write_json(path, state)
+
+def persist_quiz_state(state):
+    # 做完或放棄時傳 None，把存檔刪掉
+    return persistence.submit(lambda: save_quiz_state(state))
+
+# --------------------
+# 複習排程
+# --------------------
+LEVEL_DAYS = {1: 1, 2: 3, 3: 7, 4: 13, 5: 21}  # 各 level 距離上次複習幾天後要再複習
+MAX_LEVEL = 5
+
+def next_due_ordinal(w):
+    """單字下次到期日（date.toordinal()）；沒有 last_review 的單字回傳 0，代表一直都到期"""
+    last = w.get("last_review")
+    if last is None:
+        return 0
+    return datetime.date.fromisoformat(last).toordinal() + LEVEL_DAYS.get(w.get("level", 1), 1)
+
+class ReviewScheduler:
+    """依到期日分桶的複習排程：每個單字只記一個整數到期日，取出到期單字只看已到期的桶"""
+
+    def __init__(self, words=()):
+        self._queues = {"review": ({}, []), "permanent": ({}, [])}  # 佇列名稱 → (到期日 → {key: 單字}, 排序好的到期日)
+        self._where = {}  # key → (佇列名稱, 到期日)
+        for w in words:
+            self.update(w)
+
+    @staticmethod
+    def _queue_of(w):
+        level = w.get("level", 1)
+        if w.get("last_review") is None or level < MAX_LEVEL:
+            return "review"  # 沒複習過的單字不論 level 都要複習
+        if level == MAX_LEVEL:
+            return "permanent"
+        return None
+
+    def update(self, w, old_key=None):
+        """單字新增、複習或改名後呼叫，只搬動這一個單字"""
+        self.remove(old_key if old_key is not None else word_key(w["word"]))
+        queue = self._queue_of(w)
+        if queue is None:
+            return
+        key = word_key(w["word"])
+        due = next_due_ordinal(w)
+        buckets, days = self._queues[queue]
+        if due not in buckets:
+            buckets[due] = {}
+            bisect.insort(days, due)
+        buckets[due][key] = w
+        self._where[key] = (queue, due)
+
+    def remove(self, key):
+        where = self._where.pop(key, None)
+        if where is None:
+            return
+        queue, due = where
+        buckets, days = self._queues[queue]
+        bucket = buckets[due]
+        bucket.pop(key, None)
+        if not bucket:
+            del buckets[due]
+            days.pop(bisect.bisect_left(days, due))
+
+    def _due_in(self, queue, today):
+        buckets, days = self._queues[queue]
+        result = []
+        for due in days[:bisect.bisect_right(days, today.toordinal())]:
+            result.extend(buckets[due].values())
+        return result
+
+    def due_words(self, today=None):
+        return self._due_in("review", today or datetime.date.today())
+
+    def permanent_words(self, today=None):
+        return self._due_in("permanent", today or datetime.date.today())
+
+def get_review_scheduler():
+    return get_word_derived("scheduler")
+
+def get_due_words(words):
+    """取得今天需要複習的單字（依level間隔），沒有 last_review 的單字也會出現"""
+    if _numpy():
+        return WordColumns(words).due_words()
+    return ReviewScheduler(words).due_words()
+
+def get_permanent_words(words):
+    """取得永久記憶區單字（level==5且已答對一次）"""
+    if _numpy():
+        return WordColumns(words).permanent_words()
+    return ReviewScheduler(words).permanent_words()
+
+# --------------------
+# 單字的欄式檢視（numpy，選用）：到期篩選與 level 統計整欄一次算完
+# --------------------
+_np = None
+
+def _numpy():
+    """numpy 是選用的，第一次用到才載入；沒有安裝時回傳 None，呼叫端退回純 Python 的做法"""
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np or None
+
+class WordColumns:
+    """每個單字一列：level（int8）、上次複習日（int32 的 date ordinal，0 代表沒複習過）、是否還在。
+    列號依單字庫順序，刪除只做標記，標記太多時再壓縮"""
+
+    def __init__(self, words=()):
+        np = self._np = _numpy()
+        # 各 level 的間隔天數查表；超出範圍的 level 跟 LEVEL_DAYS.get(level, 1) 一樣當 1 天
+        self._interval = np.ones(MAX_LEVEL + 2, dtype=np.int32)
+        for level, days in LEVEL_DAYS.items():
+            if 0 <= level <= MAX_LEVEL:
+                self._interval[level] = days
+        self._words = []
+        self._rows = {}
+        levels = []
+        lasts = []
+        ordinals = {}  # 同一天的日期字串只解析一次
+        for w in words:
+            key = word_key(w["word"])
+            old = self._rows.get(key)
+            if old is not None:
+                self._words[old] = None  # 大小寫重複的舊資料只留最後一筆，跟索引一致
+            self._rows[key] = len(self._words)
+            self._words.append(w)
+            levels.append(w.get("level", 1))
+            last = w.get("last_review")
+            if last not in ordinals:
+                ordinals[last] = 0 if last is None else datetime.date.fromisoformat(last).toordinal()
+            lasts.append(ordinals[last])
+        capacity = max(len(self._words) * 2, 64)
+        self.level = np.zeros(capacity, dtype=np.int8)
+        self.last = np.zeros(capacity, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        n = len(self._words)
+        self.level[:n] = levels
+        self.last[:n] = lasts
+        self.alive[:n] = [w is not None for w in self._words]
+        self._dead = n - len(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _grow(self):
+        capacity = len(self.level) * 2
+        for name in ("level", "last", "alive"):
+            old = getattr(self, name)
+            new = self._np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def update(self, w, old_key=None):
+        """單字新增、複習或改名後呼叫；改名沿用原本的列，順序跟單字庫一致"""
+        key = word_key(w["word"])
+        row = self._rows.pop(old_key, None) if old_key is not None else None
+        if row is None:
+            row = self._rows.get(key)
+        if row is None:
+            row = len(self._words)
+            if row == len(self.level):
+                self._grow()
+            self._words.append(w)
+        else:
+            self._words[row] = w
+        self._rows[key] = row
+        last = w.get("last_review")
+        self.level[row] = w.get("level", 1)
+        self.last[row] = 0 if last is None else datetime.date.fromisoformat(last).toordinal()
+        self.alive[row] = True
+
+    def remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        self._words[row] = None
+        self.alive[row] = False
+        self._dead += 1
+        if self._dead > 1024 and self._dead * 2 > len(self._words):
+            self._compact()
+
+    def _compact(self):
+        keep = self._np.flatnonzero(self.alive[:len(self._words)])
+        n = len(keep)
+        for name in ("level", "last", "alive"):
+            column = getattr(self, name)
+            column[:n] = column[keep]
+            column[n:] = 0
+        self._words = [self._words[i] for i in keep]
+        self._rows = {word_key(w["word"]): i for i, w in enumerate(self._words)}
+        self._dead = 0
+
+    def _columns(self):
+        n = len(self._words)
+        level = self.level[:n]
+        last = self.last[:n]
+        due = last + self._interval[self._np.clip(level, 0, MAX_LEVEL + 1)]
+        return level, last, self.alive[:n], due
+
+    def _select(self, mask):
+        words = self._words
+        return [words[i] for i in self._np.flatnonzero(mask)]
+
+    def due_words(self, today=None):
+        """跟 ReviewScheduler 同樣的規則，但依單字庫順序回傳"""
+        level, last, alive, due = self._columns()
+        today = (today or datetime.date.today()).toordinal()
+        return self._select(alive & ((last == 0) | ((level < MAX_LEVEL) & (due <= today))))
+
+    def permanent_words(self, today=None):
+        level, last, alive, due = self._columns()
+        today = (today or datetime.date.today()).toordinal()
+        return self._select(alive & (level == MAX_LEVEL) & (last != 0) & (due <= today))
+
+    def level_counts(self):
+        """{level: 單字數}，只算 1 ~ MAX_LEVEL"""
+        level, _, alive, _ = self._columns()
+        counts = self._np.bincount(self._np.clip(level[alive], 0, MAX_LEVEL + 1), minlength=MAX_LEVEL + 2)
+        return {i: int(counts[i]) for i in range(1, MAX_LEVEL + 1)}
+
+    def words_by_level(self):
+        """{level: [單字資料]}，每個 level 內依單字庫順序"""
+        level, _, alive, _ = self._columns()
+        return {i: self._select(alive & (level == i)) for i in range(1, MAX_LEVEL + 1)}
+
+def get_word_columns():
+    """共用快照的欄式檢視；沒有安裝 numpy 時回傳 None"""
+    return get_word_derived("columns") if _numpy() else None
+
+def level_breakdown():
+    """目前單字記憶狀況：{level: [單字資料]}，只列 1 ~ MAX_LEVEL"""
+    store = get_shared_vocab()
+    with store.lock:
+        columns = get_word_columns()
+        if columns is not None:
+            return columns.words_by_level()
+        level_words = {i: [] for i in range(1, MAX_LEVEL + 1)}
+        for w in store.words:
+            level = w.get("level", 1)
+            if level in level_words:
+                level_words[level].append(w)
+        return level_words
+
+def grade_word(word, remembered):
+    """記得升一級、忘記降一級，換上新版本的單字並更新排程；回傳 (新的單字資料, 原本的 level)，寫檔由呼叫端決定"""
+    w = find_word(word)
+    if w is None:
+        return None, None
+    old_level = w.get("level", 1)
+    new_level = min(old_level + 1, MAX_LEVEL) if remembered else max(old_level - 1, 1)
+    w = dict(w, level=new_level, last_review=datetime.date.today().isoformat())
+    get_shared_vocab().put(w)
+    return w, old_level
+
+# --------------------
+# 單字搜尋索引（英文前綴 + 中文字元 n-gram）
+# --------------------
+SEARCH_PAGE_SIZE = 50
+
+def _meaning_grams(meaning):
+    # 單字元與相鄰兩字元都建索引，查一個字或一段詞都能用
+    grams = set(meaning)
+    grams.update(meaning[i:i + 2] for i in range(len(meaning) - 1))
+    return grams
+
+class WordSearchIndex:
+    """排序好的英文 key 清單做前綴查詢，中文意思用 n-gram 倒排索引"""
+
+    def __init__(self, words=()):
+        by_key = build_word_index(words)  # 舊資料若有大小寫重複的單字只留一筆
+        self._keys = sorted(by_key)
+        self._meanings = {}
+        self._grams = {}
+        for key, w in by_key.items():
+            self._add_meaning(key, w.get("meaning", ""))
+
+    def _add_meaning(self, key, meaning):
+        self._meanings[key] = meaning
+        for gram in _meaning_grams(meaning):
+            self._grams.setdefault(gram, set()).add(key)
+
+    def _remove_meaning(self, key):
+        for gram in _meaning_grams(self._meanings.pop(key, "")):
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+
+    def update(self, w, old_key=None):
+        self.remove(old_key if old_key is not None else word_key(w["word"]))
+        key = word_key(w["word"])
+        bisect.insort(self._keys, key)
+        self._add_meaning(key, w.get("meaning", ""))
+
+    def remove(self, key):
+        if key not in self._meanings:
+            return
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            self._keys.pop(i)
+        self._remove_meaning(key)
+
+    def prefix_range(self, prefix):
+        """回傳前綴相符的 key 在排序清單中的 (起, 訖)，不必逐一比對"""
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + "\U0010ffff")
+        return lo, hi
+
+    def keys_between(self, lo, hi):
+        return self._keys[lo:hi]
+
+    def search_meaning(self, query):
+        grams = [query] if len(query) == 1 else [query[i:i + 2] for i in range(len(query) - 1)]
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self._grams.get(g, ()))):
+            keys = self._grams.get(gram)
+            if not keys:
+                return []
+            candidates = set(keys) if candidates is None else candidates & keys
+        # n-gram 只能篩掉不可能的，最後確認整段字串真的出現在意思裡
+        return sorted(k for k in candidates if query in self._meanings[k])
+
+def get_search_index():
+    return get_word_derived("search")
+
+def search_word_keys(query, page, page_size=SEARCH_PAGE_SIZE):
+    """回傳 (這一頁的 key, 符合筆數)；英文走前綴，含中文字元走意思的 n-gram"""
+    search = get_search_index()
+    query = query.strip()
+    start = page * page_size
+    with get_shared_vocab().lock:  # 索引是所有 session 共用的，查詢時不讓別人同時更新
+        if not query or query.isascii():
+            lo, hi = search.prefix_range(word_key(query))
+            return search.keys_between(lo + start, min(hi, lo + start + page_size)), hi - lo
+        matched = search.search_meaning(query)
+    return matched[start:start + page_size], len(matched)
+
+# --------------------
+# 命令列工具（不載入介面）
+# --------------------
+def known_users():
+    """資料夾底下已經有資料的使用者"""
+    if not os.path.isdir(DATA_DIR):
+        return []
+    return sorted(name for name in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, name)))
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["rebuild-stats"]:
+        # python word_engine.py rebuild-stats <帳號>：從該使用者的 log.jsonl 重建統計彙總，不指定就處理全部使用者
+        for user in argv[1:] or known_users():
+            with acting_user(user):
+                print(f"{user}: rebuilt stats from {rebuild_stats_rollup()} answers")
+        return 0
+    if argv[:1] == ["compact"]:
+        # python word_engine.py compact <帳號>：把保留期以前的作答紀錄、測驗結果與複習紀錄壓縮成每月摘要
+        for user in argv[1:] or known_users():
+            with acting_user(user):
+                for log in (get_answer_log(), get_quiz_log(), get_review_log()):
+                    persistence.flush()  # 第一次取用時排的壓縮先做完
+                    print(f"{user}: {log.name} compacted {log.compact() or 'nothing'}")
+        return 0
+    if argv[:1] == ["import"] and len(argv) in (3, 4):
+        # python word_engine.py import <帳號> <檔案> [skip|overwrite|append]：批次匯入 CSV/TSV/JSONL，- 代表標準輸入
+        user, path = argv[1], argv[2]
+        policy = argv[3] if len(argv) == 4 else "skip"
+        with acting_user(user):
+            with (sys.stdin if path == "-" else open(path, encoding="utf-8-sig", newline="")) as f:
+                counts = import_words(f, word_file_format(path), policy)
+            persistence.flush()
+        print(f"{user}: " + ", ".join(f"{k} {v}" for k, v in counts.items()))
+        return 0
+    if argv[:1] == ["export"] and len(argv) == 3:
+        # python word_engine.py export <帳號> <檔案>：匯出單字，格式看副檔名，- 代表標準輸出（CSV）
+        user, path = argv[1], argv[2]
+        with acting_user(user):
+            words = get_shared_vocab().current_words()
+            if path == "-":
+                export_words(sys.stdout, "csv", words)
+            else:
+                with open(path, "w", encoding="utf-8", newline="") as f:
+                    print(f"{user}: exported {export_words(f, word_file_format(path), words)} words", file=sys.stderr)
+        return 0
+    print("usage: python word_engine.py rebuild-stats|compact [user ...]\n"
+          "       python word_engine.py import <user> <file> [skip|overwrite|append]\n"
+          "       python word_engine.py export <user> <file>", file=sys.stderr)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())